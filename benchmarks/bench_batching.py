@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк пропускной способности модели: батч из одного против MicroBatcher
+Использование: python benchmarks/bench_batching.py [--requests 256] [--concurrency 16]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'waste_classification.settings')
+
+import django
+
+django.setup()
+
+from classifier import ml_model
+from classifier.batching import MicroBatcher
+
+
+def load_samples():
+    """Предобрабатывает примеры изображений из ob_model/"""
+    paths = sorted(glob.glob(os.path.join(BASE_DIR, 'ob_model', '*.jpg')))
+    if not paths:
+        raise SystemExit('Нет изображений в ob_model/')
+    return [ml_model.preprocess_image(path)[0] for path in paths]
+
+
+def run(label, predict_one, samples, requests, concurrency):
+    """Прогоняет requests изображений через predict_one в concurrency потоков"""
+    inputs = [samples[i % len(samples)] for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(predict_one, inputs))
+    elapsed = time.perf_counter() - start
+    print(f'{label:<28} {requests / elapsed:8.1f} изобр./с  ({elapsed:.2f} с)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=256)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=10)
+    args = parser.parse_args()
+
+    samples = load_samples()
+    # Загрузка модели и первый trace не должны попадать в замер
+    ml_model.predict_batch(samples[0][None])
+
+    run('batch=1', lambda x: ml_model.predict_batch(x[None])[0],
+        samples, args.requests, args.concurrency)
+
+    batcher = MicroBatcher(ml_model.predict_batch, args.max_batch_size, args.max_wait_ms)
+    try:
+        # Прогрев на всех размерах пакета
+        for size in range(1, args.max_batch_size + 1):
+            ml_model.predict_batch(samples[0][None].repeat(size, axis=0))
+        run(f'micro-batch<= {args.max_batch_size}', batcher.predict,
+            samples, args.requests, args.concurrency)
+    finally:
+        batcher.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк предобработки: прежний preprocess_image против classifier.preprocessing
+на 12-мегапиксельных JPEG (как фото с телефона)
+Использование: python benchmarks/bench_preprocessing.py [--images 16] [--repeat 3]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from classifier.preprocessing import IMAGE_SIZE, allocate_batch, preprocess_batch
+
+
+def make_photo(seed, size=(4000, 3000)):
+    """Синтетическое 12-Мп фото: плавный градиент с шумом, сжатое в JPEG"""
+    rng = np.random.default_rng(seed)
+    # Генерируем в уменьшенном виде и растягиваем - так быстрее и похоже на фото
+    small = rng.integers(0, 256, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize(size, Image.BILINEAR)
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def legacy_preprocess(data):
+    """Прежний путь: полное декодирование, resize, float32-копии, expand_dims"""
+    try:
+        from tf_keras.preprocessing.image import load_img, img_to_array
+        from tf_keras.applications.efficientnet import preprocess_input
+    except ImportError:
+        # Без tf_keras воспроизводим те же шаги на PIL/NumPy
+        img = Image.open(io.BytesIO(data)).convert('RGB').resize(IMAGE_SIZE, Image.NEAREST)
+        x = np.asarray(img).astype(np.float32)
+        return np.expand_dims(x.copy(), axis=0)
+    x = img_to_array(load_img(io.BytesIO(data), target_size=IMAGE_SIZE))
+    return np.expand_dims(preprocess_input(x), axis=0)
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'Готовлю {args.images} изображений 4000x3000...')
+    photos = [make_photo(seed) for seed in range(args.images)]
+
+    legacy = timed(lambda: np.concatenate([legacy_preprocess(p) for p in photos]), args.repeat)
+    buffer = allocate_batch(args.images)
+    batched = timed(lambda: preprocess_batch(photos, out=buffer), args.repeat)
+
+    for label, elapsed in (('прежний preprocess_image', legacy), ('preprocess_batch', batched)):
+        print(f'{label:<26} {elapsed * 1000 / args.images:8.1f} мс/изобр.  {args.images / elapsed:8.1f} изобр./с')
+    print(f'Ускорение: x{legacy / batched:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк страницы теории: запросов в секунду без кэша индекса (разбор
+text.html на каждый запрос, как раньше) и с кэшем
+Использование: python benchmarks/bench_theory.py [--requests 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'waste_classification.settings')
+
+import django
+
+django.setup()
+
+from django.test import Client
+from django.test.utils import setup_test_environment
+
+from classifier import theory_index
+
+
+def run(label, client, requests, before_request=None):
+    client.get('/theory/')
+    start = time.perf_counter()
+    for _ in range(requests):
+        if before_request:
+            before_request()
+        response = client.get('/theory/')
+        assert response.status_code == 200
+    elapsed = time.perf_counter() - start
+    print(f'{label:<30} {requests / elapsed:8.1f} запр./с  ({elapsed * 1000 / requests:.2f} мс/запр.)')
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    client = Client()
+    before = run('без кэша (разбор на запрос)', client, args.requests, theory_index.clear_index)
+    after = run('с кэшем индекса', client, args.requests)
+    print(f'Ускорение: x{after / before:.1f}')
+
+
+if __name__ == '__main__':
+    main()
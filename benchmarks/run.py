@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Набор бенчмарков горячих путей: предобработка и классификация пакетами
+разного размера, загрузка модели и пиковая память, запросы в секунду к
+страницам index, theory и practice через тестовый клиент Django.
+
+Результаты пишутся в JSON; с --compare сравниваются с сохраненной базой
+(--save-baseline), и при регрессии больше --threshold процентов команда
+завершается с кодом 1. Сеть не нужна: используются изображения из ob_model/.
+
+Использование: python benchmarks/run.py [--quick] [--only preprocess,pages]
+                   [--output results.json] [--save-baseline] [--compare [baseline.json]]
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'waste_classification.settings')
+
+import django
+
+django.setup()
+
+import numpy as np
+from django.test import Client, override_settings
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+from classifier import ml_model
+from classifier.preprocessing import allocate_batch, preprocess_batch
+
+DEFAULT_BASELINE = os.path.join(BASE_DIR, 'benchmarks', 'baseline.json')
+BATCH_SIZES = (1, 8, 32)
+SUITES = ('preprocess', 'model', 'classify', 'pages')
+
+
+class Results:
+    """Плоский набор метрик: имя -> {'value', 'unit', 'better'}"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.skipped = {}
+
+    def add(self, name, value, unit, better='lower'):
+        self.metrics[name] = {'value': round(value, 4), 'unit': unit, 'better': better}
+        print(f'  {name:<40} {value:12.3f} {unit}')
+
+    def skip(self, suite, reason):
+        self.skipped[suite] = reason
+        print(f'  {suite}: пропущен ({reason})')
+
+
+def measure(fn, repeat, warmup=1):
+    """Медиана времени вызова fn за repeat повторов, секунд"""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def peak_rss_mb():
+    """Пиковая резидентная память процесса, МБ (ru_maxrss в КБ на Linux, в байтах на macOS)"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def load_sample_bytes():
+    paths = sorted(glob.glob(os.path.join(BASE_DIR, 'ob_model', '*.jpg')))
+    if not paths:
+        raise SystemExit('Нет изображений в ob_model/')
+    samples = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            samples.append(f.read())
+    return samples
+
+
+def batch_of(samples, size):
+    return [samples[i % len(samples)] for i in range(size)]
+
+
+def bench_preprocess(results, samples, repeat):
+    """preprocess_image (одно изображение) и preprocess_batch в готовый буфер"""
+    seconds = measure(lambda: ml_model.preprocess_image(samples[0]), repeat)
+    results.add('preprocess.single.latency_ms', seconds * 1000, 'ms')
+    for size in BATCH_SIZES:
+        images = batch_of(samples, size)
+        buffer = allocate_batch(size)
+        seconds = measure(lambda: preprocess_batch(images, out=buffer), repeat)
+        results.add(f'preprocess.batch_{size}.images_per_s', size / seconds, 'img/s', better='higher')
+
+
+def bench_model(results):
+    """Время загрузки модели и прирост пиковой памяти"""
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    ml_model.get_model()
+    results.add('model.load_s', time.perf_counter() - start, 's')
+    results.add('model.peak_rss_delta_mb', peak_rss_mb() - rss_before, 'MB')
+
+
+def bench_classify(results, samples, repeat):
+    """classify_waste и classify_batch без кэша предсказаний"""
+    seconds = measure(lambda: ml_model.classify_waste(samples[0]), repeat)
+    results.add('classify.single.latency_ms', seconds * 1000, 'ms')
+    for size in BATCH_SIZES:
+        images = batch_of(samples, size)
+        seconds = measure(lambda: ml_model.classify_batch(images), repeat)
+        results.add(f'classify.batch_{size}.latency_ms', seconds * 1000, 'ms')
+        results.add(f'classify.batch_{size}.images_per_s', size / seconds, 'img/s', better='higher')
+
+
+def bench_pages(results, samples, requests, classify):
+    """Запросов в секунду к страницам через тестовый клиент Django.
+
+    Запросы идут к тестовой базе, как в manage.py test: рабочая db.sqlite3
+    не нужна и не изменяется.
+    """
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        _bench_pages(results, samples, requests, classify)
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def _bench_pages(results, samples, requests, classify):
+    client = Client()
+    pages = [('index', '/'), ('theory', '/theory/'), ('practice', '/practice/')]
+    for name, url in pages:
+        client.get(url)
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = client.get(url)
+            assert response.status_code == 200, f'{url}: {response.status_code}'
+        results.add(f'pages.{name}.requests_per_s', requests / (time.perf_counter() - start), 'req/s', better='higher')
+    if classify:
+        # Синхронная отправка формы: загрузка, классификация, сохранение, рендер
+        def post():
+            response = client.post('/practice/', {'image': _upload(samples[0])})
+            assert response.status_code == 200
+        with override_settings(CLASSIFIER_ASYNC_JOBS_ENABLED=False):
+            seconds = measure(post, max(1, requests // 10))
+        results.add('pages.practice_post.latency_ms', seconds * 1000, 'ms')
+
+
+def _upload(data):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    return SimpleUploadedFile('sample.jpg', data, content_type='image/jpeg')
+
+
+def model_unavailable_reason():
+    """Причина, по которой модель не загрузить, или None"""
+    try:
+        ml_model.get_model()
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, threshold):
+    """Печатает сравнение с базой; возвращает список регрессий"""
+    regressions = []
+    print(f'\nСравнение с базой (commit {baseline.get("meta", {}).get("commit")}):')
+    for name, metric in current['metrics'].items():
+        base = baseline.get('metrics', {}).get(name)
+        if not base or not base['value']:
+            print(f'  {name:<40} {"нет в базе":>12}')
+            continue
+        change = (metric['value'] - base['value']) / base['value'] * 100
+        worse = change > threshold if metric['better'] == 'lower' else change < -threshold
+        mark = '  РЕГРЕССИЯ' if worse else ''
+        print(f'  {name:<40} {base["value"]:12.3f} -> {metric["value"]:12.3f} {metric["unit"]:<6} {change:+7.1f}%{mark}')
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки классификатора и страниц')
+    parser.add_argument('--only', default=','.join(SUITES),
+                        help=f'Наборы через запятую: {", ".join(SUITES)}')
+    parser.add_argument('--repeat', type=int, default=20, help='Повторов на замер (берется медиана)')
+    parser.add_argument('--requests', type=int, default=200, help='Запросов на страницу')
+    parser.add_argument('--quick', action='store_true', help='Короткий прогон: --repeat 5 --requests 30')
+    parser.add_argument('--output', help='Файл для результатов в JSON (по умолчанию только вывод на экран)')
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, metavar='PATH',
+                        help='Сохранить результаты как базу для сравнения')
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, metavar='PATH',
+                        help='Сравнить с базой и завершиться с кодом 1 при регрессии')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Допустимое ухудшение, процентов')
+    args = parser.parse_args()
+    if args.quick:
+        args.repeat, args.requests = 5, 30
+    suites = [suite.strip() for suite in args.only.split(',') if suite.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f'неизвестные наборы: {", ".join(sorted(unknown))}')
+
+    samples = load_sample_bytes()
+    results = Results()
+    # Кэш предсказаний выключен, чтобы замерять модель, а не словарь в памяти;
+    # метрики пишутся во временный каталог, чтобы не смешиваться с рабочими
+    with tempfile.TemporaryDirectory() as tmp_dir, override_settings(
+            CLASSIFIER_CACHE_ENABLED=False, CLASSIFIER_METRICS_DIR=tmp_dir, CLASSIFIER_SAVE_UPLOADS=False):
+        if 'preprocess' in suites:
+            print('preprocess')
+            bench_preprocess(results, samples, args.repeat)
+        # Классификация и отправка формы замеряются, только если модель загружается
+        reason = None
+        if 'model' in suites:
+            print('model')
+            try:
+                bench_model(results)
+            except Exception as e:
+                reason = f'{type(e).__name__}: {e}'
+                results.skip('model', reason)
+        elif {'classify', 'pages'} & set(suites):
+            reason = model_unavailable_reason()
+        if 'classify' in suites:
+            print('classify')
+            if reason:
+                results.skip('classify', reason)
+            else:
+                bench_classify(results, samples, args.repeat)
+        if 'pages' in suites:
+            print('pages')
+            bench_pages(results, samples, args.requests, classify=reason is None)
+    results.add('process.peak_rss_mb', peak_rss_mb(), 'MB')
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'django': django.get_version(),
+            'backend': getattr(django.conf.settings, 'CLASSIFIER_BACKEND', 'keras'),
+            'repeat': args.repeat,
+            'requests': args.requests,
+        },
+        'metrics': results.metrics,
+        'skipped': results.skipped,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'\nРезультаты записаны в {path}')
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f'\nРегрессии больше {args.threshold}%: {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
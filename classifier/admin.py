@@ -5,7 +5,10 @@ from django.urls import reverse
 from django.utils.html import escape
 from django.forms import Textarea
 from django.db import models
-from .models import TheorySection, TheoryNavigation
+from django.db.models import Count
+from django.utils import timezone
+from .models import TheorySection, TheoryNavigation, deferred_theory_invalidation, invalidate_theory_cache
+from .search import search_all_sections
 
 
 class TheorySectionInline(admin.TabularInline):
@@ -29,7 +32,8 @@ class TheorySectionInline(admin.TabularInline):
 class TheorySectionAdmin(admin.ModelAdmin):
     list_display = ['display_title', 'section_id', 'level_badge', 'order', 'is_active', 'is_active_badge', 'children_count', 'parent_link', 'updated_at']
     list_filter = ['level', 'is_active', 'created_at', 'parent']
-    search_fields = ['title', 'section_id', 'content']
+    # Поиск по содержимому идет через полнотекстовый индекс (см. get_search_results)
+    search_fields = ['title', 'section_id']
     list_editable = ['order', 'is_active']
     ordering = ['order', 'level', 'id']
     list_per_page = 50
@@ -61,7 +65,20 @@ class TheorySectionAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('parent')
+        # Родитель и число подглав достаются тем же запросом, что и сами секции
+        return super().get_queryset(request).select_related('parent').annotate(
+            _children_count=Count('children', distinct=True)
+        )
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Добавляет к поиску по заголовку секции, найденные полнотекстовым индексом
+        (по всем секциям, включая неактивные)"""
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            section_ids = search_all_sections(search_term)
+            if section_ids:
+                results |= queryset.filter(section_id__in=section_ids)
+        return results, may_have_duplicates
     
     def display_title(self, obj):
         """Отображает заголовок с отступом в зависимости от уровня"""
@@ -104,12 +121,15 @@ class TheorySectionAdmin(admin.ModelAdmin):
     
     def children_count(self, obj):
         """Количество подглав"""
-        count = obj.children.count()
+        count = getattr(obj, '_children_count', None)
+        if count is None:
+            count = obj.children.count()
         if count > 0:
             url = reverse('admin:classifier_theorysection_changelist') + f'?parent__id__exact={obj.id}'
             return format_html('<a href="{}">{} подглав(ы)</a>', url, count)
         return '-'
     children_count.short_description = 'Подглавы'
+    children_count.admin_order_field = '_children_count'
     
     def parent_link(self, obj):
         """Ссылка на родительскую секцию"""
@@ -154,41 +174,59 @@ class TheorySectionAdmin(admin.ModelAdmin):
     
     actions = ['make_active', 'make_inactive', 'set_level_1', 'set_level_2', 'duplicate_sections']
     
+    def changelist_view(self, request, extra_context=None):
+        """Сохранение list_editable и действия над списком сбрасывают кэш теории один раз"""
+        with deferred_theory_invalidation():
+            return super().changelist_view(request, extra_context)
+    
+    def delete_queryset(self, request, queryset):
+        """Массовое удаление одним запросом и один сброс кэша"""
+        super().delete_queryset(request, queryset)
+        invalidate_theory_cache()
+    
+    def _update_sections(self, queryset, **fields):
+        """UPDATE выбранных секций одним запросом; updated_at обновляем явно,
+        так как queryset.update() не трогает поля с auto_now"""
+        updated = queryset.update(updated_at=timezone.now(), **fields)
+        invalidate_theory_cache()
+        return updated
+    
     def make_active(self, request, queryset):
         """Активировать выбранные секции"""
-        updated = queryset.update(is_active=True)
+        updated = self._update_sections(queryset, is_active=True)
         self.message_user(request, f'✓ {updated} секций активировано.', level='success')
     make_active.short_description = '✅ Активировать выбранные секции'
     
     def make_inactive(self, request, queryset):
         """Деактивировать выбранные секции"""
-        updated = queryset.update(is_active=False)
+        updated = self._update_sections(queryset, is_active=False)
         self.message_user(request, f'✗ {updated} секций деактивировано.', level='warning')
     make_inactive.short_description = '❌ Деактивировать выбранные секции'
     
     def set_level_1(self, request, queryset):
         """Установить уровень 1"""
-        updated = queryset.update(level=1, parent=None)
+        updated = self._update_sections(queryset, level=1, parent=None)
         self.message_user(request, f'✓ {updated} секций установлено на уровень 1 (основные главы).', level='success')
     set_level_1.short_description = '📖 Установить уровень 1 (основные главы)'
     
     def set_level_2(self, request, queryset):
         """Установить уровень 2"""
-        updated = queryset.update(level=2)
+        updated = self._update_sections(queryset, level=2)
         self.message_user(request, f'✓ {updated} секций установлено на уровень 2 (подглавы).', level='success')
     set_level_2.short_description = '📄 Установить уровень 2 (подглавы)'
     
     def duplicate_sections(self, request, queryset):
-        """Дублировать выбранные секции"""
-        count = 0
-        for obj in queryset:
+        """Дублировать выбранные секции (одним INSERT)"""
+        copies = []
+        for count, obj in enumerate(queryset.order_by('order', 'id')):
             obj.pk = None
             obj.section_id = f"{obj.section_id}_copy_{count}"
             obj.title = f"{obj.title} (копия)"
             obj.order = obj.order + 1000  # Ставим в конец
-            obj.save()
-            count += 1
-        self.message_user(request, f'✓ {count} секций продублировано.', level='success')
+            copies.append(obj)
+        TheorySection.objects.bulk_create(copies)
+        invalidate_theory_cache()
+        self.message_user(request, f'✓ {len(copies)} секций продублировано.', level='success')
     duplicate_sections.short_description = '📋 Дублировать выбранные секции'
 
 
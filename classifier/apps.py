@@ -1,6 +1,24 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ClassifierConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'classifier'
+
+    def ready(self):
+        # Прогрев модели при старте процесса (runserver, воркеры gunicorn),
+        # но не для остальных команд manage.py вроде migrate или collectstatic
+        if not getattr(settings, 'CLASSIFIER_WARMUP_ON_STARTUP', False):
+            return
+        if sys.argv[0].endswith('manage.py'):
+            if sys.argv[1:2] != ['runserver']:
+                return
+            # Родительский процесс автоперезагрузчика runserver запросы не обслуживает
+            if '--noreload' not in sys.argv and os.environ.get('RUN_MAIN') != 'true':
+                return
+        from .ml_model import start_warmup
+        start_warmup()
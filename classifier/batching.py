@@ -0,0 +1,85 @@
+"""
+Динамическая пакетная обработка (micro-batching) запросов к модели
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Собирает одиночные запросы в пакеты и выполняет один predict на весь пакет.
+
+    Запросы складываются в очередь; фоновый поток ждет первый запрос, затем
+    добирает до max_batch_size изображений, но не дольше max_wait_ms, и
+    передает собранный пакет в predict_fn. Каждый вызывающий получает свою
+    строку результата.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=10):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='classifier-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, x):
+        """Ставит одно изображение (без размерности батча) в очередь, возвращает Future"""
+        if self._stopped.is_set():
+            raise RuntimeError("MicroBatcher остановлен")
+        future = Future()
+        self._queue.put((x, future))
+        return future
+
+    def predict(self, x, timeout=None):
+        """Синхронный вариант submit: ждет и возвращает вектор вероятностей"""
+        return self.submit(x).result(timeout=timeout)
+
+    def stop(self):
+        """Останавливает фоновый поток (оставшиеся запросы будут обработаны)"""
+        self._stopped.set()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        """Собирает пакет: блокируется до первого запроса, затем ждет не дольше max_wait"""
+        item = self._queue.get()
+        if item is None:
+            return []
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Сигнал остановки вернем в очередь, чтобы завершиться после этого пакета
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            # Отмененные запросы не отправляем в модель
+            batch = [(x, future) for x, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            futures = [future for _, future in batch]
+            try:
+                predictions = self.predict_fn(np.stack([x for x, _ in batch]))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, row in zip(futures, predictions):
+                future.set_result(row)
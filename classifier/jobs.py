@@ -0,0 +1,102 @@
+"""
+Асинхронные задачи классификации: загрузка сразу возвращает id задачи,
+инференс выполняется в фоновом пуле потоков, результат хранится в кэше
+"""
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .ml_model import classify_waste
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_ERROR = 'error'
+
+FINISHED_STATUSES = (STATUS_DONE, STATUS_ERROR)
+
+# Пул создается при первой задаче, свой в каждом процессе: всего одновременно
+# выполняется до (воркеры gunicorn) * CLASSIFIER_JOB_WORKERS задач
+_executor = None
+_executor_lock = threading.Lock()
+# Незавершенные задачи процесса (в очереди и выполняемые)
+_queue_slots = None
+
+
+class QueueFull(Exception):
+    """Очередь задач процесса заполнена"""
+
+
+def _get_queue_slots():
+    global _queue_slots
+    if _queue_slots is None:
+        with _executor_lock:
+            if _queue_slots is None:
+                _queue_slots = threading.BoundedSemaphore(getattr(settings, 'CLASSIFIER_JOB_QUEUE_SIZE', 100))
+    return _queue_slots
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'CLASSIFIER_JOB_WORKERS', 2),
+                    thread_name_prefix='classifier-job',
+                )
+    return _executor
+
+
+def get_cache():
+    # Кэш задач должен быть общим для всех воркеров: опрос может прийти в другой процесс
+    return caches[getattr(settings, 'CLASSIFIER_JOBS_CACHE_ALIAS', 'jobs')]
+
+
+def _key(job_id):
+    return f'classifier_job:{job_id}'
+
+
+def _store(job_id, **state):
+    get_cache().set(_key(job_id), state)
+
+
+def submit(image_data, image_url=None):
+    """Ставит изображение в очередь на классификацию и возвращает id задачи.
+
+    Если в процессе уже CLASSIFIER_JOB_QUEUE_SIZE незавершенных задач,
+    бросает QueueFull.
+    """
+    slots = _get_queue_slots()
+    if not slots.acquire(blocking=False):
+        raise QueueFull("Очередь задач заполнена")
+    job_id = uuid.uuid4().hex
+    try:
+        _store(job_id, status=STATUS_PENDING, image_url=image_url)
+        get_executor().submit(_run, job_id, image_data, image_url)
+    except BaseException:
+        slots.release()
+        raise
+    return job_id
+
+
+def get(job_id):
+    """Возвращает состояние задачи или None, если задача не найдена (или устарела)"""
+    return get_cache().get(_key(job_id))
+
+
+def _run(job_id, image_data, image_url):
+    try:
+        _store(job_id, status=STATUS_RUNNING, image_url=image_url)
+        try:
+            result = classify_waste(image_data)
+        except Exception as e:
+            _store(job_id, status=STATUS_ERROR, image_url=image_url,
+                   error=f"Ошибка при обработке изображения: {str(e)}")
+        else:
+            _store(job_id, status=STATUS_DONE, image_url=image_url, result=result)
+    finally:
+        _get_queue_slots().release()
@@ -0,0 +1,26 @@
+"""
+Команда для статической сборки страницы теории (HTML + .gz/.br для nginx)
+Использование: python manage.py build_theory_static [--clear]
+"""
+from django.core.management.base import BaseCommand
+
+from classifier.theory_static import brotli, build_theory_static, clear_theory_static, get_static_root
+
+
+class Command(BaseCommand):
+    help = 'Рендерит страницу теории и все секции в статические файлы со сжатыми вариантами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true',
+                            help='Только удалить сборку (страницу снова будет отдавать Django)')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            clear_theory_static()
+            self.stdout.write(self.style.SUCCESS(f'OK: сборка удалена из {get_static_root()}'))
+            return
+
+        count = build_theory_static()
+        self.stdout.write(self.style.SUCCESS(f'OK: записано файлов: {count} в {get_static_root()}'))
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('Пакет brotli не установлен - варианты .br не созданы.'))
@@ -0,0 +1,161 @@
+"""
+Команда для пакетной разметки изображений из каталога
+Использование: python manage.py classify_dir <каталог> --output labels.csv [--resume]
+"""
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from classifier.ml_model import CATEGORIES, format_predictions, predict_batch
+from classifier.preprocessing import allocate_batch, decode_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+FIELDS = ['path', 'class', 'class_ru', 'waste_bin', 'confidence', *CATEGORIES, 'error']
+
+
+def _decode_path(path):
+    """Декодирует файл в процессе пула; возвращает (путь, массив или None, ошибка)"""
+    try:
+        return path, decode_image(path), ''
+    except Exception as e:
+        return path, None, str(e)
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = 'Классифицирует все изображения в каталоге и потоково пишет результаты в CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог с изображениями (обходится рекурсивно)')
+        parser.add_argument('--output', required=True, help='Файл результатов: .csv или .jsonl')
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'CLASSIFIER_API_BATCH_SIZE', 32),
+                            help='Размер пакета для predict')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Число процессов для декодирования изображений')
+        parser.add_argument('--resume', action='store_true',
+                            help='Продолжить с места остановки: пропустить файлы, уже записанные в --output')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        output = options['output']
+        if not os.path.isdir(directory):
+            raise CommandError(f'Каталог не найден: {directory}')
+        self.jsonl = output.endswith('.jsonl')
+        if not self.jsonl and not output.endswith('.csv'):
+            raise CommandError('--output должен иметь расширение .csv или .jsonl')
+
+        done = self._load_checkpoint(output) if options['resume'] else set()
+        if done:
+            self.stdout.write(f'Продолжаю: {len(done)} файлов уже размечено')
+
+        self.directory = directory
+        self.stats = {'processed': 0, 'errors': 0, 'decode_wait': 0.0, 'predict': 0.0}
+        self.buffer = allocate_batch(options['batch_size'])
+        paths = (path for path in self._iter_images(directory) if self._relative(path) not in done)
+
+        start = time.perf_counter()
+        with open(output, 'a' if done else 'w', encoding='utf-8', newline='') as f:
+            self.writer = None if self.jsonl else csv.DictWriter(f, fieldnames=FIELDS)
+            if self.writer and not done:
+                self.writer.writeheader()
+            self.file = f
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                # Декодирование следующих пакетов идет, пока модель обрабатывает текущий;
+                # в памяти одновременно не больше двух пакетов сверх текущего
+                pending = deque()
+                for batch_paths in _chunked(paths, options['batch_size']):
+                    pending.append(pool.map(_decode_path, batch_paths))
+                    if len(pending) > 2:
+                        self._process(pending.popleft())
+                while pending:
+                    self._process(pending.popleft())
+        elapsed = time.perf_counter() - start
+
+        processed = self.stats['processed']
+        self.stdout.write(self.style.SUCCESS(f'OK: результаты записаны в {output}'))
+        self.stdout.write(f'  Обработано: {processed} (ошибок: {self.stats["errors"]}, пропущено: {len(done)})')
+        self.stdout.write(f'  Время: {elapsed:.1f} с, {processed / elapsed if elapsed else 0:.1f} изобр./с')
+        self.stdout.write(f'  Ожидание декодирования: {self.stats["decode_wait"]:.1f} с, '
+                          f'predict: {self.stats["predict"]:.1f} с')
+
+    def _iter_images(self, directory):
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.directory).replace(os.sep, '/')
+
+    def _load_checkpoint(self, output):
+        """Возвращает уже размеченные пути; обрезает недописанную последнюю строку"""
+        if not os.path.exists(output):
+            return set()
+        with open(output, 'rb+') as f:
+            data = f.read()
+            complete = data.rfind(b'\n') + 1
+            if complete < len(data):
+                f.truncate(complete)
+        text = data[:complete].decode('utf-8')
+        if self.jsonl:
+            return {json.loads(line)['path'] for line in text.splitlines() if line.strip()}
+        return {row['path'] for row in csv.DictReader(text.splitlines())}
+
+    def _process(self, decoded):
+        wait_start = time.perf_counter()
+        decoded = list(decoded)
+        self.stats['decode_wait'] += time.perf_counter() - wait_start
+
+        images = [(path, array) for path, array, _ in decoded if array is not None]
+        for path, _, error in decoded:
+            if error:
+                self._write({'path': self._relative(path), 'error': error})
+                self.stats['errors'] += 1
+
+        if images:
+            batch = self.buffer[:len(images)]
+            for i, (_, array) in enumerate(images):
+                batch[i] = array
+            predict_start = time.perf_counter()
+            predictions = predict_batch(batch)
+            self.stats['predict'] += time.perf_counter() - predict_start
+
+            # Метки всего пакета одним вызовом (top-1 и порог CLASSIFIER_MIN_CONFIDENCE)
+            labels = format_predictions(predictions, top_k=1)
+            for (path, _), probabilities, label in zip(images, predictions, labels):
+                self._write({
+                    'path': self._relative(path),
+                    'class': label['class'],
+                    'class_ru': label['class_ru'],
+                    'waste_bin': label['waste_bin'],
+                    'confidence': round(label['confidence'], 4),
+                    'probabilities': {name: round(float(p), 6) for name, p in zip(CATEGORIES, probabilities)},
+                })
+        self.stats['processed'] += len(decoded)
+        self.file.flush()
+
+    def _write(self, row):
+        if self.jsonl:
+            self.file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        else:
+            probabilities = row.pop('probabilities', {})
+            self.writer.writerow({**row, **probabilities})
@@ -0,0 +1,25 @@
+"""
+Команда для очистки каталога загрузок по бюджету размера и возраста
+Использование: python manage.py evict_uploads [--max-mb 500] [--max-age-days 30]
+"""
+from django.core.management.base import BaseCommand
+
+from classifier.uploads import evict_uploads, get_upload_dir
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые загрузки и самые давние сверх бюджета по размеру (вместе с миниатюрами)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-mb', type=float, default=None,
+                            help='Бюджет каталога загрузок в мегабайтах (по умолчанию CLASSIFIER_UPLOAD_MAX_BYTES)')
+        parser.add_argument('--max-age-days', type=float, default=None,
+                            help='Максимальный возраст загрузки в днях (по умолчанию CLASSIFIER_UPLOAD_MAX_AGE_DAYS)')
+
+    def handle(self, *args, **options):
+        max_bytes = int(options['max_mb'] * 1024 * 1024) if options['max_mb'] is not None else None
+        deleted, freed, remaining = evict_uploads(max_bytes=max_bytes, max_age_days=options['max_age_days'])
+        self.stdout.write(self.style.SUCCESS(
+            f'OK: удалено загрузок: {deleted} ({freed / 1024 / 1024:.1f} МБ), '
+            f'в {get_upload_dir()}/ осталось {remaining / 1024 / 1024:.1f} МБ'
+        ))
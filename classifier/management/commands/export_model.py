@@ -0,0 +1,89 @@
+"""
+Команда для экспорта модели EfficientNet (.h5) в TFLite с опциональным квантованием
+Использование: python manage.py export_model [--quantize none|float16|int8] [--calibration-dir ob_model]
+"""
+import glob
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from classifier import ml_model
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.webp')
+
+
+def find_images(directory):
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(directory, '**', pattern), recursive=True))
+    return sorted(paths)
+
+
+class Command(BaseCommand):
+    help = 'Экспортирует модель Keras в TFLite и сравнивает точность с исходной моделью'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=None,
+                            help='Исходная модель .h5 (по умолчанию CLASSIFIER_MODEL_PATH)')
+        parser.add_argument('--output', default=None,
+                            help='Файл .tflite (по умолчанию CLASSIFIER_TFLITE_MODEL_PATH)')
+        parser.add_argument('--quantize', choices=['none', 'float16', 'int8'], default='none',
+                            help='Квантование весов: float16 или int8 (калибровка на --calibration-dir)')
+        parser.add_argument('--calibration-dir', default=None,
+                            help='Изображения для калибровки int8 и сравнения точности (по умолчанию ob_model/)')
+
+    def handle(self, *args, **options):
+        source = options['source'] or ml_model.get_model_path('keras')
+        output = options['output'] or ml_model.get_model_path('tflite')
+        calibration_dir = options['calibration_dir'] or os.path.dirname(str(source))
+        if not os.path.exists(source):
+            raise CommandError(f'Модель не найдена по пути: {source}')
+
+        images = find_images(calibration_dir)
+        if not images:
+            raise CommandError(f'Нет изображений для калибровки и проверки в {calibration_dir}')
+        samples = np.concatenate([ml_model.preprocess_image(path) for path in images])
+
+        self.stdout.write(f'Загружаю {source}...')
+        keras_backend = ml_model.KerasBackend(source)
+
+        import tensorflow as tf
+        converter = tf.lite.TFLiteConverter.from_keras_model(keras_backend.model)
+        if options['quantize'] == 'float16':
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif options['quantize'] == 'int8':
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = lambda: ([sample[None]] for sample in samples)
+
+        self.stdout.write(f'Конвертирую в TFLite (квантование: {options["quantize"]})...')
+        tflite_model = converter.convert()
+        with open(output, 'wb') as f:
+            f.write(tflite_model)
+
+        tflite_backend = ml_model.TFLiteBackend(output)
+        expected, keras_time = self._timed(keras_backend.predict, samples)
+        actual, tflite_time = self._timed(tflite_backend.predict, samples)
+
+        agreement = float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1))) * 100
+        diff = np.abs(expected - actual)
+
+        self.stdout.write(self.style.SUCCESS(f'OK: модель сохранена в {output}'))
+        self.stdout.write(f'  Размер: {os.path.getsize(source) / 2**20:.1f} МБ -> {os.path.getsize(output) / 2**20:.1f} МБ')
+        self.stdout.write(f'  Изображений для сравнения: {len(samples)}')
+        self.stdout.write(f'  Совпадение top-1 с Keras: {agreement:.1f}%')
+        self.stdout.write(f'  Разница вероятностей: макс. {diff.max() * 100:.3f} п.п., средн. {diff.mean() * 100:.4f} п.п.')
+        self.stdout.write(f'  Время на изображение: Keras {keras_time * 1000 / len(samples):.1f} мс, '
+                          f'TFLite {tflite_time * 1000 / len(samples):.1f} мс')
+        if agreement < 100:
+            self.stdout.write(self.style.WARNING('Внимание: предсказанные классы расходятся с исходной моделью.'))
+        self.stdout.write('Чтобы использовать модель, установите CLASSIFIER_BACKEND = "tflite" в settings.py')
+
+    def _timed(self, predict, samples):
+        # Первый вызов (трассировка графа, аллокация тензоров) в замер не входит
+        predict(samples[:1])
+        start = time.perf_counter()
+        predictions = np.concatenate([predict(sample[None]) for sample in samples])
+        return predictions, time.perf_counter() - start
@@ -9,11 +9,15 @@ from classifier.utils import parse_html_to_sections
 class Command(BaseCommand):
     help = 'Импортирует теорию из MHT или HTML файла в базу данных'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None,
+                            help='HTML файл учебника (по умолчанию text.html в корне проекта)')
+
     def handle(self, *args, **options):
         self.stdout.write('Начинаю импорт теории...')
         self.stdout.write('Ищу файлы: .mht или .htm')
         
-        success, message = parse_html_to_sections()
+        success, message = parse_html_to_sections(options['file'])
         
         if success:
             self.stdout.write(self.style.SUCCESS(f'OK: {message}'))
@@ -0,0 +1,47 @@
+"""
+Команда для запуска локального сервера модели (одна копия модели на все воркеры gunicorn)
+Использование: python manage.py run_model_server [--socket /run/wasteclfmodel-model.sock]
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from classifier import ml_model
+from classifier.batching import MicroBatcher
+from classifier.model_server import ModelServer
+
+
+class Command(BaseCommand):
+    help = 'Запускает сервер модели, принимающий предобработанные тензоры через Unix-сокет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=getattr(settings, 'CLASSIFIER_MODEL_SERVER_SOCKET', ''),
+                            help='Путь к Unix-сокету (по умолчанию CLASSIFIER_MODEL_SERVER_SOCKET)')
+
+    def handle(self, *args, **options):
+        socket_path = options['socket']
+        if not socket_path:
+            raise CommandError('Укажите --socket или CLASSIFIER_MODEL_SERVER_SOCKET в settings.py')
+
+        max_batch_size = getattr(settings, 'CLASSIFIER_BATCH_MAX_SIZE', 16)
+        # Сокет создаем до загрузки модели: воркеры, пришедшие во время прогрева,
+        # ждут ответа, а не считают сервер недоступным
+        server = ModelServer(socket_path)
+        self.stdout.write('Загружаю и прогреваю модель...')
+        # Сервер всегда собирает запросы в пакеты до max_batch_size, независимо
+        # от CLASSIFIER_BATCHING_ENABLED: прогреваем все эти размеры
+        ml_model.warmup(predict=ml_model.predict_local, batch_sizes=range(1, max_batch_size + 1))
+
+        batcher = MicroBatcher(
+            ml_model.predict_local,
+            max_batch_size=max_batch_size,
+            max_wait_ms=getattr(settings, 'CLASSIFIER_BATCH_MAX_WAIT_MS', 10),
+        )
+        server.batcher = batcher
+        self.stdout.write(self.style.SUCCESS(f'Сервер модели слушает {socket_path}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            batcher.stop()
@@ -0,0 +1,283 @@
+"""
+Метрики производительности классификатора
+
+Каждый процесс (воркер gunicorn, сервер модели) копит гистограммы и счетчики
+в памяти и периодически сбрасывает их в свой файл CLASSIFIER_METRICS_DIR/<pid>-<id>.json.
+Представление /metrics суммирует файлы всех процессов и отдает их в текстовом
+формате Prometheus. Файлы завершившихся процессов сливаются в dead.json, чтобы
+счетчики не уменьшались при перезапуске воркеров.
+
+Длительности этапов текущего запроса дополнительно собираются для заголовка
+Server-Timing (см. classifier/middleware.py).
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: слияние файлов без блокировки
+    fcntl = None
+
+# Границы корзин гистограмм
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MODEL_LOAD_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# Описание метрик: имя -> (тип, описание, корзины)
+DEFINITIONS = {
+    'classifier_stage_seconds': ('histogram', 'Длительность этапов обработки изображения', TIME_BUCKETS),
+    'classifier_model_load_seconds': ('histogram', 'Время загрузки модели', MODEL_LOAD_BUCKETS),
+    'classifier_batch_size': ('histogram', 'Размер пакета одного вызова модели', BATCH_SIZE_BUCKETS),
+    'classifier_http_request_seconds': ('histogram', 'Длительность обработки запроса Django', TIME_BUCKETS),
+    'classifier_predictions_total': ('counter', 'Число классифицированных изображений', None),
+}
+
+DEAD_FILE = 'dead.json'
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_process_id = uuid.uuid4().hex[:8]
+_last_flush = 0.0
+
+# Длительности этапов текущего запроса для Server-Timing
+_request = threading.local()
+
+
+def is_enabled():
+    return getattr(settings, 'CLASSIFIER_METRICS_ENABLED', True)
+
+
+def get_metrics_dir():
+    return str(getattr(settings, 'CLASSIFIER_METRICS_DIR', os.path.join(settings.BASE_DIR, 'cache', 'metrics')))
+
+
+def _labels_key(labels):
+    return json.dumps(sorted(labels.items()), ensure_ascii=False)
+
+
+def observe(name, value, **labels):
+    """Добавляет значение в гистограмму name"""
+    if not is_enabled():
+        return
+    buckets = DEFINITIONS[name][2]
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        key = _labels_key(labels)
+        # [счетчики корзин..., +Inf, сумма]
+        values = series.get(key)
+        if values is None:
+            values = series[key] = [0] * (len(buckets) + 1) + [0.0]
+        values[bisect.bisect_left(buckets, value)] += 1
+        values[-1] += value
+    _maybe_flush()
+
+
+def inc(name, amount=1, **labels):
+    """Увеличивает счетчик name"""
+    if not is_enabled():
+        return
+    with _lock:
+        series = _counters.setdefault(name, {})
+        key = _labels_key(labels)
+        series[key] = series.get(key, 0) + amount
+    _maybe_flush()
+
+
+@contextmanager
+def timer(stage):
+    """Замеряет этап обработки: гистограмма classifier_stage_seconds и Server-Timing"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('classifier_stage_seconds', elapsed, stage=stage)
+        timings = getattr(_request, 'timings', None)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def start_request():
+    """Начинает сбор длительностей этапов для текущего запроса"""
+    _request.timings = {}
+
+
+def finish_request():
+    """Возвращает {этап: секунды} текущего запроса и завершает сбор"""
+    timings = getattr(_request, 'timings', None) or {}
+    _request.timings = None
+    return timings
+
+
+def _snapshot():
+    with _lock:
+        return {
+            'histograms': {name: {key: list(values) for key, values in series.items()}
+                           for name, series in _histograms.items()},
+            'counters': {name: dict(series) for name, series in _counters.items()},
+        }
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def flush():
+    """Сбрасывает метрики процесса в его файл"""
+    global _last_flush
+    _last_flush = time.monotonic()
+    if not _histograms and not _counters:
+        return
+    metrics_dir = get_metrics_dir()
+    os.makedirs(metrics_dir, exist_ok=True)
+    _write_json(os.path.join(metrics_dir, f'{os.getpid()}-{_process_id}.json'), _snapshot())
+
+
+def _maybe_flush():
+    if time.monotonic() - _last_flush >= getattr(settings, 'CLASSIFIER_METRICS_FLUSH_INTERVAL', 1.0):
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _flush_quietly():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+def _reset_after_fork():
+    """В дочернем процессе (gunicorn --preload) метрики родителя не повторяем"""
+    global _process_id, _last_flush
+    _histograms.clear()
+    _counters.clear()
+    _process_id = uuid.uuid4().hex[:8]
+    _last_flush = 0.0
+
+
+atexit.register(_flush_quietly)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _merge(total, data):
+    for name, series in data.get('histograms', {}).items():
+        merged = total['histograms'].setdefault(name, {})
+        for key, values in series.items():
+            if key in merged:
+                merged[key] = [a + b for a, b in zip(merged[key], values)]
+            else:
+                merged[key] = list(values)
+    for name, series in data.get('counters', {}).items():
+        merged = total['counters'].setdefault(name, {})
+        for key, value in series.items():
+            merged[key] = merged.get(key, 0) + value
+    return total
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _collect_dead(metrics_dir):
+    """Сливает файлы завершившихся процессов в dead.json"""
+    dead_paths = []
+    for path in glob.glob(os.path.join(metrics_dir, '*-*.json')):
+        try:
+            pid = int(os.path.basename(path).split('-', 1)[0])
+        except ValueError:
+            continue
+        if pid != os.getpid() and not _is_alive(pid):
+            dead_paths.append(path)
+    if not dead_paths:
+        return
+
+    with open(os.path.join(metrics_dir, 'dead.lock'), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        dead_file = os.path.join(metrics_dir, DEAD_FILE)
+        total = _read_json(dead_file) or {'histograms': {}, 'counters': {}}
+        merged = []
+        for path in dead_paths:
+            data = _read_json(path)
+            if data is not None:
+                _merge(total, data)
+                merged.append(path)
+        _write_json(dead_file, total)
+        for path in merged:
+            os.remove(path)
+
+
+def collect():
+    """Метрики всех процессов, просуммированные по файлам"""
+    flush()
+    metrics_dir = get_metrics_dir()
+    _collect_dead(metrics_dir)
+    total = {'histograms': {}, 'counters': {}}
+    for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+        data = _read_json(path)
+        if data is not None:
+            _merge(total, data)
+    return total
+
+
+def _format_labels(key, extra=()):
+    pairs = [*json.loads(key), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(data=None):
+    """Текст метрик в формате Prometheus"""
+    data = data if data is not None else collect()
+    lines = []
+    for name, (kind, description, buckets) in DEFINITIONS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for key, value in sorted(data['counters'].get(name, {}).items()):
+                lines.append(f'{name}{_format_labels(key)} {_format_number(value)}')
+            continue
+        for key, values in sorted(data['histograms'].get(name, {}).items()):
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), values[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(key, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(key)} {_format_number(values[-1])}')
+            lines.append(f'{name}_count{_format_labels(key)} {cumulative}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,34 @@
+"""
+Заголовок Server-Timing и длительность запросов для /metrics
+"""
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+
+class ServerTimingMiddleware:
+    """Замеряет обработку запроса и отдает длительности этапов (metrics.timer)
+    в заголовке Server-Timing, чтобы их было видно в DevTools браузера"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = metrics.finish_request()
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        metrics.observe('classifier_http_request_seconds', total,
+                        view=match.url_name or match.view_name if match else 'unresolved')
+        if getattr(settings, 'CLASSIFIER_SERVER_TIMING', True):
+            entries = [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in timings.items()]
+            entries.append(f'total;dur={total * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(entries)
+        return response
@@ -1,12 +1,15 @@
 import os
+import threading
+import time
 import numpy as np
-from PIL import Image
-import tensorflow as tf
-import tf_keras as keras  # Используем tf_keras для совместимости со старыми моделями
-from tf_keras.applications.efficientnet import preprocess_input
-from tf_keras.preprocessing.image import load_img, img_to_array
 from django.conf import settings
 
+from . import metrics, prediction_cache
+from .preprocessing import IMAGE_SIZE, allocate_batch, decode_image, preprocess_batch
+
+# tensorflow/tf_keras импортируются лениво внутри KerasBackend: для бэкенда
+# tflite полный стек TensorFlow в процессе не нужен
+
 # Категории отходов (из ноутбука EfficientNet)
 CATEGORIES = ['battery', 'biological', 'cardboard', 'clothes', 'glass',
               'metal', 'paper', 'plastic', 'shoes', 'trash']
@@ -39,78 +42,377 @@ WASTE_BINS = {
     'trash': 'контейнер для прочего мусора'
 }
 
-# Глобальная переменная для модели
-_model = None
+# Русские названия в порядке выходов модели
+CATEGORY_NAMES_RU = [CATEGORIES_RU[name] for name in CATEGORIES]
 
-def get_model():
-    """Загружает модель EfficientNet классификации отходов"""
-    global _model
-    if _model is None:
-        # Загружаем модель EfficientNet из ob_model
-        model_path = os.path.join(settings.BASE_DIR, 'ob_model', 'waste_classifier_efficientnet.h5')
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Модель не найдена по пути: {model_path}")
-        
+# Результат при уверенности ниже CLASSIFIER_MIN_CONFIDENCE
+UNCERTAIN_CLASS = 'uncertain'
+UNCERTAIN_CLASS_RU = 'Не удалось определить'
+UNCERTAIN_WASTE_BIN = 'уточните тип по маркировке на упаковке или загрузите другое фото'
+
+class KerasBackend:
+    """Исходная модель Keras (.h5), выполняется через tensorflow + tf_keras"""
+
+    def __init__(self, model_path):
         # Используем tf_keras для загрузки легаси модели
         try:
             # tf_keras предназначен для загрузки моделей Keras 2.x в TensorFlow 2.16+
             os.environ["TF_USE_LEGACY_KERAS"] = "1"
-            _model = keras.models.load_model(model_path, compile=False)
+            import tf_keras as keras  # Используем tf_keras для совместимости со старыми моделями
+            self.model = keras.models.load_model(model_path, compile=False)
         except Exception as e:
             raise RuntimeError(
                 f"Не удалось загрузить модель с помощью tf_keras: {e}\n"
                 f"Убедитесь, что установлены пакеты: tensorflow>=2.16 и tf_keras"
             )
-    
+
+    def predict(self, batch):
+        return self.model.predict(batch, verbose=0)
+
+
+class TFLiteBackend:
+    """Модель, экспортированная в TFLite (manage.py export_model), на легком CPU-рантайме.
+
+    На каждый размер пакета держится свой Interpreter: resize_tensor_input +
+    allocate_tensors на одном интерпретаторе перевыделяли бы память при каждой
+    смене размера и сводили бы на нет прогрев. Размеров не больше
+    CLASSIFIER_BATCH_MAX_SIZE, веса файла модели рантайм отображает в память один раз.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        # batch_size -> (interpreter, input_details, output_details)
+        self._interpreters = {}
+        # Interpreter не потокобезопасен
+        self._lock = threading.Lock()
+        interpreter = load_tflite_interpreter(model_path, num_threads=num_threads)
+        interpreter.allocate_tensors()
+        self._add(interpreter)
+
+    def _add(self, interpreter):
+        entry = (interpreter, interpreter.get_input_details()[0], interpreter.get_output_details()[0])
+        self._interpreters[int(entry[1]['shape'][0])] = entry
+        return entry
+
+    def _get(self, batch_size):
+        entry = self._interpreters.get(batch_size)
+        if entry is None:
+            interpreter = load_tflite_interpreter(self.model_path, num_threads=self.num_threads)
+            index = interpreter.get_input_details()[0]['index']
+            interpreter.resize_tensor_input(index, [batch_size, *IMAGE_SIZE, 3])
+            interpreter.allocate_tensors()
+            entry = self._add(interpreter)
+        return entry
+
+    def predict(self, batch):
+        with self._lock:
+            interpreter, input_details, output_details = self._get(len(batch))
+            x = batch
+            scale, zero_point = input_details['quantization']
+            if scale:
+                # Полностью целочисленная модель: квантуем вход
+                x = np.round(batch / scale + zero_point)
+            interpreter.set_tensor(input_details['index'], x.astype(input_details['dtype']))
+            interpreter.invoke()
+            output = interpreter.get_tensor(output_details['index'])
+            scale, zero_point = output_details['quantization']
+            if scale:
+                output = (output.astype(np.float32) - zero_point) * scale
+            return output
+
+
+def load_tflite_interpreter(model_path, num_threads=None):
+    """Создает TFLite Interpreter из самого легкого доступного рантайма"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=str(model_path), num_threads=num_threads)
+
+
+# Доступные бэкенды (выбираются через CLASSIFIER_BACKEND)
+BACKENDS = {
+    'keras': KerasBackend,
+    'tflite': TFLiteBackend,
+}
+
+# Глобальная переменная для модели
+_model = None
+_model_lock = threading.Lock()
+
+# Глобальный сборщик пакетов (создается при первом обращении)
+_batcher = None
+_batcher_lock = threading.Lock()
+
+# Клиент сервера модели (если включен CLASSIFIER_MODEL_SERVER_SOCKET)
+_model_client = None
+
+# Состояние прогрева модели (см. warmup и представление ready)
+_warmup_done = threading.Event()
+_warmup_error = None
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+def get_model_path(backend=None):
+    """Путь к файлу модели для указанного бэкенда"""
+    backend = backend or getattr(settings, 'CLASSIFIER_BACKEND', 'keras')
+    if backend == 'tflite':
+        return getattr(settings, 'CLASSIFIER_TFLITE_MODEL_PATH',
+                       os.path.join(settings.BASE_DIR, 'ob_model', 'waste_classifier_efficientnet.tflite'))
+    return getattr(settings, 'CLASSIFIER_MODEL_PATH',
+                   os.path.join(settings.BASE_DIR, 'ob_model', 'waste_classifier_efficientnet.h5'))
+
+def get_model():
+    """Загружает модель EfficientNet классификации отходов в выбранном бэкенде"""
+    global _model
+    if _model is None:
+        # Прогрев, потоки задач и сборщик пакетов могут обратиться к модели
+        # одновременно: загружаем ее один раз
+        with _model_lock:
+            if _model is None:
+                _model = _load_model()
     return _model
 
-def preprocess_image(image_path):
-    """Предобрабатывает изображение для классификации (224x224, как в ноутбуке)"""
-    # Загружаем изображение через tf_keras (как в ноутбуке)
-    img = load_img(image_path, target_size=(224, 224))
-    x = img_to_array(img)
-    
-    # Применяем предобработку EfficientNet (ВАЖНО!)
-    x = preprocess_input(x)
-    
-    # Добавляем размерность батча
-    x = np.expand_dims(x, axis=0)
+def _load_model():
+    backend = getattr(settings, 'CLASSIFIER_BACKEND', 'keras')
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд модели: {backend}. Доступны: {', '.join(BACKENDS)}")
+    model_path = get_model_path(backend)
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Модель не найдена по пути: {model_path}")
     
-    return x
+    start = time.perf_counter()
+    if backend == 'tflite':
+        model = TFLiteBackend(model_path, num_threads=getattr(settings, 'CLASSIFIER_TFLITE_THREADS', None))
+    else:
+        model = KerasBackend(model_path)
+    metrics.observe('classifier_model_load_seconds', time.perf_counter() - start, backend=backend)
+    return model
 
-def classify_waste(image_path):
-    """Классифицирует изображение отходов"""
+def preprocess_image(image):
+    """Предобрабатывает изображение для классификации (224x224, как в ноутбуке).
+
+    image - путь к файлу, bytes, файловый объект или массив NumPy (H, W, 3).
+    Возвращает пакет из одного изображения формы (1, 224, 224, 3).
+    """
+    with metrics.timer('preprocess'):
+        return preprocess_batch([image])
+
+def predict_local(batch):
+    """Выполняет предсказание моделью, загруженной в текущий процесс"""
     model = get_model()
+    # Размер пакета, с которым на самом деле вызвана модель: в режиме сервера
+    # модели это собранный из запросов всех воркеров пакет
+    metrics.observe('classifier_batch_size', len(batch))
+    return model.predict(batch)
+
+def get_model_client():
+    """Возвращает клиент сервера модели или None, если режим сервера выключен"""
+    global _model_client
+    socket_path = getattr(settings, 'CLASSIFIER_MODEL_SERVER_SOCKET', '')
+    if not socket_path:
+        return None
+    if _model_client is None:
+        from .model_server import ModelServerClient
+        _model_client = ModelServerClient(
+            socket_path, timeout=getattr(settings, 'CLASSIFIER_MODEL_SERVER_TIMEOUT', 30)
+        )
+    return _model_client
+
+def predict_batch(batch):
+    """Выполняет предсказание для пакета изображений формы (N, 224, 224, 3)"""
+    client = get_model_client()
+    if client is not None:
+        from .model_server import ModelServerUnavailable
+        try:
+            return client.predict(batch)
+        except ModelServerUnavailable:
+            # Без сервера модели работаем по-старому - моделью в своем процессе.
+            # ModelServerTimeout сюда не попадает и сразу уходит к вызывающему.
+            if not getattr(settings, 'CLASSIFIER_MODEL_SERVER_FALLBACK', False):
+                raise
+    return predict_local(batch)
+
+def get_batcher():
+    """Возвращает общий MicroBatcher, настроенный из settings"""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                from .batching import MicroBatcher
+                _batcher = MicroBatcher(
+                    predict_batch,
+                    max_batch_size=getattr(settings, 'CLASSIFIER_BATCH_MAX_SIZE', 16),
+                    max_wait_ms=getattr(settings, 'CLASSIFIER_BATCH_MAX_WAIT_MS', 10),
+                )
+    return _batcher
+
+def get_supported_batch_sizes():
+    """Размеры пакетов, с которыми модель вызывается во время работы"""
+    if getattr(settings, 'CLASSIFIER_BATCHING_ENABLED', False):
+        return list(range(1, getattr(settings, 'CLASSIFIER_BATCH_MAX_SIZE', 16) + 1))
+    return [1]
+
+def warmup(predict=None, batch_sizes=None):
+    """Загружает модель и прогоняет пустые пакеты всех размеров, чтобы трассировка
+    графа произошла до первого пользовательского запроса"""
+    global _warmup_error
+    predict = predict or predict_batch
+    try:
+        for batch_size in batch_sizes or get_supported_batch_sizes():
+            predict(np.zeros((batch_size, *IMAGE_SIZE, 3), dtype=np.float32))
+    except Exception as e:
+        _warmup_error = e
+        raise
+    _warmup_error = None
+    _warmup_done.set()
+
+def start_warmup():
+    """Запускает warmup в фоновом потоке (повторные вызовы ничего не делают)"""
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_warmup_quietly, name='classifier-warmup', daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+def _warmup_quietly():
+    try:
+        warmup()
+    except Exception:
+        # Ошибка сохранена в _warmup_error и будет показана представлением ready
+        pass
+
+def get_warmup_status():
+    """Возвращает (готово, ошибка) для проверки готовности"""
+    if not getattr(settings, 'CLASSIFIER_WARMUP_ON_STARTUP', False):
+        # Прогрев выключен: модель загрузится при первом запросе, ждать нечего
+        return True, None
+    return _warmup_done.is_set(), _warmup_error
+
+def top_k_indices(probabilities, k):
+    """Индексы k самых вероятных классов для каждой строки матрицы (N, C), по убыванию"""
+    if k >= probabilities.shape[1]:
+        return np.argsort(-probabilities, axis=1, kind='stable')
+    # argpartition отбирает k лучших за линейное время, сортируются только они
+    top = np.argpartition(-probabilities, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(probabilities, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+def format_predictions(probabilities, top_k=None, min_confidence=None):
+    """Строит результаты для матрицы вероятностей (N, C) всего пакета.
+
+    top_k - сколько самых вероятных классов оставить в all_predictions
+    (None - полное распределение, оно нужно только HTML-странице).
+    min_confidence - порог уверенности в процентах (по умолчанию
+    CLASSIFIER_MIN_CONFIDENCE): ниже него вместо класса возвращается uncertain.
+    """
+    probabilities = np.asarray(probabilities)
+    if min_confidence is None:
+        min_confidence = getattr(settings, 'CLASSIFIER_MIN_CONFIDENCE', 0)
+    k = min(top_k, len(CATEGORIES)) if top_k else len(CATEGORIES)
+    indices = top_k_indices(probabilities, k)
+    # В процентах; float64, как float(p) * 100
+    percents = np.take_along_axis(probabilities, indices, axis=1).astype(np.float64) * 100
     
-    # Предобрабатываем изображение
-    img_array = preprocess_image(image_path)
-    
-    # Делаем предсказание
-    predictions = model.predict(img_array, verbose=0)
-    predicted_class_idx = np.argmax(predictions[0])
-    confidence = float(predictions[0][predicted_class_idx]) * 100  # В процентах
-    
-    # Получаем название класса
-    predicted_class = CATEGORIES[predicted_class_idx]
-    predicted_class_ru = CATEGORIES_RU[predicted_class]
+    results = []
+    for row_indices, row_percents in zip(indices.tolist(), percents.tolist()):
+        predicted_class = CATEGORIES[row_indices[0]]
+        confidence = row_percents[0]
+        uncertain = confidence < min_confidence
+        results.append({
+            'class': UNCERTAIN_CLASS if uncertain else predicted_class,
+            'class_ru': UNCERTAIN_CLASS_RU if uncertain else CATEGORIES_RU[predicted_class],
+            'waste_bin': UNCERTAIN_WASTE_BIN if uncertain else WASTE_BINS[predicted_class],
+            'confidence': confidence,
+            'uncertain': uncertain,
+            'all_predictions': {
+                CATEGORY_NAMES_RU[i]: percent for i, percent in zip(row_indices, row_percents)
+            },
+        })
+    return results
+
+def classify_waste(image, top_k=None, min_confidence=None):
+    """Классифицирует изображение отходов (путь, bytes, файловый объект или массив NumPy)"""
+    # Повторно загруженное изображение берем из кэша, не обращаясь к модели
+    digest = None
+    probabilities = None
+    if prediction_cache.is_enabled():
+        with metrics.timer('cache'):
+            image = prediction_cache.read_image_bytes(image)
+            digest = prediction_cache.image_digest(image)
+            probabilities = prediction_cache.get(digest)
     
-    # Получаем информацию о мусорном контейнере
-    waste_bin = WASTE_BINS[predicted_class]
+    if probabilities is None:
+        # Предобрабатываем изображение
+        img_array = preprocess_image(image)
+        
+        # Делаем предсказание: через общий пакет при включенном batching, иначе батч из одного
+        with metrics.timer('predict'):
+            if getattr(settings, 'CLASSIFIER_BATCHING_ENABLED', False):
+                probabilities = get_batcher().predict(img_array[0])
+            else:
+                probabilities = predict_batch(img_array)[0]
+        metrics.inc('classifier_predictions_total')
+        if digest is not None:
+            prediction_cache.set(digest, probabilities)
     
-    # Создаем словарь всех предсказаний с русскими названиями
-    all_predictions = {}
-    for i in range(len(CATEGORIES)):
-        class_name = CATEGORIES[i]
-        class_name_ru = CATEGORIES_RU[class_name]
-        all_predictions[class_name_ru] = float(predictions[0][i]) * 100
+    with metrics.timer('postprocess'):
+        return format_predictions(np.asarray(probabilities)[None], top_k, min_confidence)[0]
+
+def classify_batch(images, top_k=None, min_confidence=None):
+    """Классифицирует список изображений одним вызовом predict на пакет.
+
+    Возвращает список словарей того же вида, что classify_waste; если
+    изображение не удалось декодировать, элемент - {'error': сообщение}.
+    Постобработка (top_k, порог уверенности) выполняется сразу для всего списка.
+    """
+    results = [None] * len(images)
+    digests = [None] * len(images)
+    # Вероятности классов по номеру изображения (из кэша или от модели)
+    probabilities = {}
+    use_cache = prediction_cache.is_enabled()
+    # Слишком большие изображения отклоняются по заголовку, до декодирования
+    max_pixels = getattr(settings, 'CLASSIFIER_UPLOAD_MAX_PIXELS', 40_000_000)
+    pending = []
+    for i, image in enumerate(images):
+        try:
+            if use_cache:
+                image = prediction_cache.read_image_bytes(image)
+                digests[i] = prediction_cache.image_digest(image)
+                cached = prediction_cache.get(digests[i])
+                if cached is not None:
+                    probabilities[i] = cached
+                    continue
+            with metrics.timer('decode'):
+                pending.append((i, decode_image(image, max_pixels=max_pixels)))
+        except Exception as e:
+            results[i] = {'error': f"Ошибка при обработке изображения: {str(e)}"}
     
-    # Сортируем предсказания по убыванию вероятности
-    all_predictions_sorted = dict(sorted(all_predictions.items(), key=lambda x: x[1], reverse=True))
+    # Пакет ограничен по размеру, чтобы большой архив не занял всю память
+    chunk_size = getattr(settings, 'CLASSIFIER_API_BATCH_SIZE', 32)
+    buffer = allocate_batch(min(chunk_size, len(pending)))
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        with metrics.timer('preprocess'):
+            batch = preprocess_batch([decoded for _, decoded in chunk], out=buffer)
+        with metrics.timer('predict'):
+            probabilities_batch = predict_batch(batch)
+        for (i, _), row in zip(chunk, probabilities_batch):
+            probabilities[i] = row
+            if digests[i] is not None:
+                prediction_cache.set(digests[i], row)
+        metrics.inc('classifier_predictions_total', len(chunk))
     
-    return {
-        'class': predicted_class,
-        'class_ru': predicted_class_ru,
-        'waste_bin': waste_bin,
-        'confidence': confidence,
-        'all_predictions': all_predictions_sorted
-    }
+    if probabilities:
+        with metrics.timer('postprocess'):
+            order = list(probabilities)
+            matrix = np.stack([probabilities[i] for i in order])
+            for i, result in zip(order, format_predictions(matrix, top_k, min_confidence)):
+                results[i] = result
+    return results
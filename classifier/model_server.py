@@ -0,0 +1,150 @@
+"""
+Локальный сервер модели: один процесс держит модель в памяти,
+веб-воркеры отправляют ему предобработанные тензоры через Unix-сокет.
+
+Формат кадра (в обе стороны): 1 байт статуса, 8 байт длины (big-endian),
+затем тело. Тело запроса и успешного ответа - массив в формате .npy,
+тело ответа с ошибкой - текст сообщения в UTF-8.
+"""
+import io
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import numpy as np
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+_HEADER = struct.Struct('>BQ')
+
+
+class ModelServerUnavailable(Exception):
+    """Сервер модели недоступен (нет сокета, соединение оборвано и т.п.)"""
+
+
+class ModelServerError(Exception):
+    """Сервер модели вернул ошибку при предсказании"""
+
+
+class ModelServerTimeout(ModelServerError):
+    """Сервер модели не ответил за отведенное время (например, еще загружает модель).
+
+    Не считается недоступностью: пакет уже отправлен, повторять его и
+    загружать модель в своем процессе нельзя.
+    """
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Соединение закрыто")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_frame(sock, status, body):
+    sock.sendall(_HEADER.pack(status, len(body)) + body)
+
+
+def recv_frame(sock):
+    status, size = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return status, _recv_exactly(sock, size)
+
+
+def encode_array(array):
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(array), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def decode_array(body):
+    return np.load(io.BytesIO(body), allow_pickle=False)
+
+
+class _PredictHandler(socketserver.BaseRequestHandler):
+    """Обрабатывает кадры одного клиента, пока он держит соединение"""
+
+    def handle(self):
+        while True:
+            try:
+                _, body = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                batch = decode_array(body)
+                # Каждое изображение идет в общий MicroBatcher: запросы разных
+                # веб-воркеров объединяются в один predict
+                futures = [self.server.batcher.submit(x) for x in batch]
+                predictions = np.stack([future.result() for future in futures])
+                send_frame(self.request, STATUS_OK, encode_array(predictions))
+            except Exception as e:
+                send_frame(self.request, STATUS_ERROR, str(e).encode('utf-8'))
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Сокет создается сразу в конструкторе: пока модель прогревается (batcher
+    еще не задан), подключения ждут в очереди, а не получают отказ"""
+    daemon_threads = True
+    # Очередь подключений на время прогрева: все потоки всех воркеров gunicorn
+    request_queue_size = 128
+
+    def __init__(self, socket_path, batcher=None):
+        self.batcher = batcher
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _PredictHandler)
+        os.chmod(socket_path, 0o660)
+
+
+class ModelServerClient:
+    """Клиент сервера модели; держит по одному соединению на поток"""
+
+    def __init__(self, socket_path, timeout=30):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise ModelServerUnavailable(f"Сервер модели недоступен ({self.socket_path}): {e}")
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def predict(self, batch):
+        """Отправляет пакет (N, 224, 224, 3) и возвращает матрицу вероятностей"""
+        body = encode_array(batch)
+        # Одна повторная попытка: сервер мог быть перезапущен между запросами
+        for attempt in range(2):
+            if getattr(self._local, 'sock', None) is None:
+                self._local.sock = self._connect()
+            try:
+                send_frame(self._local.sock, STATUS_OK, body)
+                status, response = recv_frame(self._local.sock)
+                break
+            except socket.timeout as e:
+                # Соединение в неизвестном состоянии - закрываем, но не повторяем
+                self._close()
+                raise ModelServerTimeout(f"Сервер модели не ответил за {self.timeout} с: {e}")
+            except (ConnectionError, OSError) as e:
+                self._close()
+                if attempt:
+                    raise ModelServerUnavailable(f"Ошибка связи с сервером модели: {e}")
+        if status != STATUS_OK:
+            raise ModelServerError(response.decode('utf-8', 'replace'))
+        return decode_array(response)
@@ -1,7 +1,68 @@
+import threading
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
 from django.db import models
-from django.core.cache import cache
+from django.core.cache import caches
+from django.db import transaction
 from django.utils.text import slugify
 
+# Ключ поколения теории в общем кэше (см. get_theory_generation)
+THEORY_GENERATION_CACHE_KEY = 'theory_generation'
+
+
+# Состояние отложенной инвалидации (см. deferred_theory_invalidation), свое у каждого потока
+_deferred = threading.local()
+
+
+def get_theory_cache():
+    """Кэш поколения теории; должен быть общим для всех процессов (воркеры
+    gunicorn, manage.py import_theory), поэтому по умолчанию файловый"""
+    return caches[getattr(settings, 'CLASSIFIER_THEORY_CACHE_ALIAS', 'theory')]
+
+
+def get_theory_generation():
+    """Текущее поколение теории: меняется при каждом изменении секций в любом процессе"""
+    cache = get_theory_cache()
+    generation = cache.get(THEORY_GENERATION_CACHE_KEY)
+    if generation is None:
+        cache.add(THEORY_GENERATION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+        generation = cache.get(THEORY_GENERATION_CACHE_KEY)
+    return generation
+
+
+def publish_theory_change():
+    """Новое поколение теории (процессы пересоберут ее при следующем запросе)
+    и обновление статической сборки"""
+    get_theory_cache().set(THEORY_GENERATION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+    from .theory_static import refresh_theory_static
+    refresh_theory_static()
+
+
+def invalidate_theory_cache():
+    """Сбрасывает кэш навигации и секций теории и устаревшую статическую сборку"""
+    if getattr(_deferred, 'depth', 0):
+        _deferred.pending = True
+        return
+    # После коммита транзакции, иначе другой процесс может успеть закэшировать
+    # еще не сохраненные данные под новым поколением
+    transaction.on_commit(publish_theory_change)
+
+
+@contextmanager
+def deferred_theory_invalidation():
+    """Откладывает сброс кэша теории до выхода из блока: сколько бы секций ни
+    сохранилось внутри, кэш и статическая сборка сбрасываются один раз"""
+    _deferred.depth = getattr(_deferred, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _deferred.depth -= 1
+        if not _deferred.depth and getattr(_deferred, 'pending', False):
+            _deferred.pending = False
+            invalidate_theory_cache()
+
 
 class TheorySection(models.Model):
     """Модель для секций теории"""
@@ -33,14 +94,12 @@ class TheorySection(models.Model):
     def save(self, *args, **kwargs):
         """При сохранении очищаем кэш"""
         super().save(*args, **kwargs)
-        cache.delete('theory_navigation')
-        cache.delete('theory_sections')
+        invalidate_theory_cache()
 
     def delete(self, *args, **kwargs):
         """При удалении очищаем кэш"""
         super().delete(*args, **kwargs)
-        cache.delete('theory_navigation')
-        cache.delete('theory_sections')
+        invalidate_theory_cache()
 
 
 class TheoryNavigation(models.Model):
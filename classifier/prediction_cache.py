@@ -0,0 +1,105 @@
+"""
+Кэш предсказаний по хэшу содержимого изображения
+
+Хранятся вероятности классов, а не готовый результат: top_k и порог
+уверенности применяются при каждом обращении (ml_model.format_predictions).
+"""
+import hashlib
+import os
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+HITS_KEY = 'prediction_cache:hits'
+MISSES_KEY = 'prediction_cache:misses'
+
+# Версия модели вычисляется один раз на процесс
+_model_version = None
+
+
+def is_enabled():
+    return getattr(settings, 'CLASSIFIER_CACHE_ENABLED', True)
+
+
+def get_cache():
+    return caches[getattr(settings, 'CLASSIFIER_CACHE_ALIAS', 'predictions')]
+
+
+def get_model_version():
+    """Версия модели для ключа кэша: из settings или по бэкенду, размеру и mtime файла модели"""
+    global _model_version
+    if _model_version is None:
+        version = getattr(settings, 'CLASSIFIER_MODEL_VERSION', '')
+        if not version:
+            from .ml_model import get_model_path
+            backend = getattr(settings, 'CLASSIFIER_BACKEND', 'keras')
+            model_path = get_model_path(backend)
+            try:
+                stat = os.stat(model_path)
+                version = f'{backend}-{stat.st_size}-{int(stat.st_mtime)}'
+            except OSError:
+                version = backend
+        _model_version = version
+    return _model_version
+
+
+def read_image_bytes(image):
+    """Приводит путь или файловый объект к bytes; bytes и массивы возвращает как есть"""
+    if isinstance(image, (bytes, bytearray, memoryview, np.ndarray)):
+        return image
+    if hasattr(image, 'read'):
+        data = image.read()
+        if hasattr(image, 'seek'):
+            image.seek(0)
+        return data
+    with open(image, 'rb') as f:
+        return f.read()
+
+
+def image_digest(image):
+    """SHA-256 содержимого изображения (bytes или массива NumPy)"""
+    digest = hashlib.sha256()
+    if isinstance(image, np.ndarray):
+        digest.update(f'{image.shape}{image.dtype}'.encode())
+        image = np.ascontiguousarray(image)
+    digest.update(memoryview(image).cast('B'))
+    return digest.hexdigest()
+
+
+def make_key(digest):
+    return f'probabilities:{get_model_version()}:{digest}'
+
+
+def get(digest):
+    """Возвращает сохраненные вероятности классов или None; учитывает попадания и промахи"""
+    cache = get_cache()
+    result = cache.get(make_key(digest))
+    _increment(cache, HITS_KEY if result is not None else MISSES_KEY)
+    return result
+
+
+def set(digest, probabilities):
+    get_cache().set(make_key(digest), probabilities)
+
+
+def get_stats():
+    """Счетчики попаданий и промахов кэша предсказаний"""
+    cache = get_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+    }
+
+
+def _increment(cache, key):
+    # Счетчики хранятся в самом кэше, чтобы общий бэкенд суммировал их по всем воркерам
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
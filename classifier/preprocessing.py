@@ -0,0 +1,113 @@
+"""
+Быстрая предобработка изображений для модели
+
+Изображение декодируется сразу в уменьшенном размере (draft-режим JPEG,
+reduce для остальных форматов), масштабируется в uint8 и одним присваиванием
+записывается в заранее выделенный float32-буфер пакета. Загрузки
+пользователей до этого нормализуются (normalize_image): размеры проверяются
+по заголовку, слишком большие изображения отклоняются, большие - уменьшаются.
+"""
+import io
+
+import numpy as np
+from PIL import Image
+
+# Размер входа модели
+IMAGE_SIZE = (224, 224)
+
+# Тег EXIF с ориентацией снимка
+EXIF_ORIENTATION = 0x0112
+
+
+class ImageTooLargeError(ValueError):
+    """Изображение больше допустимого числа пикселей"""
+
+
+def check_image_pixels(img, max_pixels):
+    """Отклоняет изображение по размерам из заголовка, не декодируя его"""
+    if max_pixels and img.width * img.height > max_pixels:
+        raise ImageTooLargeError(
+            f"Изображение {img.width}x{img.height} больше допустимых {max_pixels} пикселей")
+
+
+def open_image(image):
+    """Открывает изображение из пути, байтов, файлового объекта или массива NumPy"""
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(np.asarray(image, dtype=np.uint8))
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        # Декодируем прямо из памяти, без записи на диск
+        return Image.open(io.BytesIO(image))
+    return Image.open(image)
+
+
+def decode_image(image, size=IMAGE_SIZE, max_pixels=None):
+    """Декодирует изображение в массив uint8 формы (H, W, 3) нужного размера"""
+    if isinstance(image, np.ndarray) and image.shape == (size[1], size[0], 3):
+        # Уже нужного размера - декодировать и масштабировать нечего
+        return image
+    with open_image(image) as img:
+        check_image_pixels(img, max_pixels)
+        if img.format == 'JPEG':
+            # JPEG декодируется сразу с масштабом 1/2..1/8, но не меньше size
+            img.draft('RGB', size)
+        else:
+            # Для остальных форматов - быстрое целочисленное уменьшение
+            factor = min(img.width // size[0], img.height // size[1])
+            if factor > 1:
+                if img.mode not in ('RGB', 'L'):
+                    # reduce не поддерживает палитру и часть режимов (P, 1, I;16)
+                    img = img.convert('RGB')
+                img = img.reduce(factor)
+        img = img.convert('RGB')
+        if img.size != size:
+            # Как load_img(target_size=...) из tf_keras - ближайший сосед
+            img = img.resize(size, Image.NEAREST)
+        return np.asarray(img)
+
+
+def normalize_image(data, max_side, max_pixels=None, quality=90):
+    """Приводит загруженное изображение (bytes) к разумному размеру.
+
+    Изображения больше max_pixels отклоняются по заголовку (ImageTooLargeError),
+    длинная сторона больше max_side уменьшается до max_side (JPEG декодируется
+    сразу уменьшенным) с перекодированием в JPEG. Ориентация из EXIF
+    сохраняется. Небольшие изображения возвращаются без изменений.
+    """
+    with open_image(data) as img:
+        check_image_pixels(img, max_pixels)
+        if max(img.size) <= max_side:
+            return data
+        orientation = img.getexif().get(EXIF_ORIENTATION)
+        if img.format == 'JPEG':
+            img.draft('RGB', (max_side, max_side))
+        img = img.convert('RGB')
+        img.thumbnail((max_side, max_side), Image.BILINEAR, reducing_gap=None)
+        exif = Image.Exif()
+        if orientation:
+            exif[EXIF_ORIENTATION] = orientation
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=quality, exif=exif)
+        return buffer.getvalue()
+
+
+def allocate_batch(batch_size, size=IMAGE_SIZE):
+    """Выделяет float32-буфер пакета формы (N, H, W, 3)"""
+    return np.empty((batch_size, size[1], size[0], 3), dtype=np.float32)
+
+
+def preprocess_batch(images, out=None, size=IMAGE_SIZE):
+    """Заполняет пакет (N, 224, 224, 3) float32 изображениями из images.
+
+    out - заранее выделенный буфер (allocate_batch); по умолчанию создается новый.
+    preprocess_input для EfficientNet - тождественное преобразование
+    (нормализация встроена в модель), поэтому достаточно привести uint8 к float32
+    при записи в буфер.
+    """
+    images = list(images)
+    if out is None:
+        out = allocate_batch(len(images), size)
+    elif len(out) < len(images):
+        raise ValueError(f"Буфер на {len(out)} изображений, передано {len(images)}")
+    for i, image in enumerate(images):
+        out[i] = decode_image(image, size)
+    return out[:len(images)]
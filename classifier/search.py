@@ -0,0 +1,226 @@
+"""
+Полнотекстовый поиск по секциям теории
+
+Небольшой инвертированный индекс в памяти процесса: HTML очищается от тегов,
+слова нормализуются (нижний регистр, ё -> е, отсечение русских окончаний),
+ранжирование - BM25 с повышенным весом совпадений в заголовке. Индекс
+обновляется инкрементально: заново обрабатываются только секции, версия
+которых изменилась (хэш содержимого или updated_at строки в базе), а при
+неизменной версии теории секции не сравниваются вовсе.
+"""
+import hashlib
+import html
+import math
+import re
+import threading
+from collections import Counter
+
+from .models import TheorySection
+from .theory_index import get_theory
+
+TAG_RE = re.compile(r'<[^>]+>')
+SPACE_RE = re.compile(r'\s+')
+WORD_RE = re.compile(r'\w+')
+
+# Окончания русских слов, от длинных к коротким
+RUSSIAN_ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'иях', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией',
+    'ых', 'их', 'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ий', 'ый', 'ой', 'ей', 'ам', 'ям',
+    'ах', 'ях', 'ом', 'ем', 'ов', 'ев', 'ть', 'ти', 'ую', 'юю', 'ию', 'ью', 'ия', 'ья',
+    'ии', 'а', 'я', 'о', 'е', 'и', 'ы', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+REFLEXIVE_ENDINGS = ('ся', 'сь')
+MIN_STEM_LENGTH = 3
+
+# Параметры BM25 и вес заголовка
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 3
+
+SNIPPET_RADIUS = 80
+
+
+def strip_html(fragment):
+    """Текст без HTML-тегов и лишних пробелов"""
+    return SPACE_RE.sub(' ', html.unescape(TAG_RE.sub(' ', fragment))).strip()
+
+
+def normalize_word(word):
+    """Нормализует слово: нижний регистр, ё -> е, отсечение окончания"""
+    word = word.lower().replace('ё', 'е')
+    for ending in REFLEXIVE_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            word = word[:-len(ending)]
+            break
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    return [normalize_word(word) for word in WORD_RE.findall(text)]
+
+
+def content_version(title, fragment):
+    """Версия секции по ее заголовку и HTML"""
+    return hashlib.md5(f'{title}\x00{fragment}'.encode('utf-8')).hexdigest()
+
+
+class SearchIndex:
+    """Инвертированный индекс секций: термин -> {id секции: частота}"""
+
+    def __init__(self):
+        self.documents = {}
+        self.postings = {}
+        # Версия набора секций из последнего update() (например, поколение теории)
+        self.version = None
+        # update() меняет словари на месте: поиск и сниппеты читают их под той же блокировкой
+        self._lock = threading.RLock()
+
+    def update(self, sections, titles, version=None):
+        """Синхронизирует индекс с секциями {id: HTML}; возвращает число переиндексированных.
+
+        version - версия всего набора секций: если она совпадает с версией
+        прошлого вызова, секции не хэшируются и не сравниваются.
+        """
+        with self._lock:
+            if version is not None and version == self.version:
+                return 0
+            versions = {
+                section_id: content_version(titles.get(section_id, ''), fragment)
+                for section_id, fragment in sections.items()
+            }
+            changed = self.sync(versions, lambda ids: {
+                section_id: (titles.get(section_id, ''), sections[section_id]) for section_id in ids
+            })
+            self.version = version
+            return changed
+
+    def sync(self, versions, load):
+        """Синхронизирует индекс с версиями секций {id: версия}.
+
+        load(ids) возвращает {id: (заголовок, HTML)} и вызывается только для
+        новых и изменившихся секций. Возвращает число переиндексированных.
+        """
+        with self._lock:
+            for section_id in set(self.documents) - set(versions):
+                self._remove(section_id)
+            stale = [
+                section_id for section_id, version in versions.items()
+                if section_id not in self.documents or self.documents[section_id]['version'] != version
+            ]
+            if not stale:
+                return 0
+            for section_id, (title, fragment) in load(stale).items():
+                if section_id in self.documents:
+                    self._remove(section_id)
+                self._add(section_id, title, fragment, versions[section_id])
+            return len(stale)
+
+    def _add(self, section_id, title, fragment, version):
+        text = strip_html(fragment)
+        terms = Counter(tokenize(text))
+        for term in tokenize(title):
+            terms[term] += TITLE_WEIGHT
+        self.documents[section_id] = {
+            'version': version, 'title': title, 'text': text,
+            'terms': terms, 'length': sum(terms.values()),
+        }
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[section_id] = count
+
+    def _remove(self, section_id):
+        document = self.documents.pop(section_id)
+        for term in document['terms']:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(section_id, None)
+                if not postings:
+                    del self.postings[term]
+
+    def search(self, query, limit=10):
+        """Возвращает [(id секции, оценка)] по убыванию релевантности (limit=None - все)"""
+        terms = set(tokenize(query))
+        with self._lock:
+            return self._search(terms, limit)
+
+    def _search(self, terms, limit):
+        if not terms or not self.documents:
+            return []
+        total = len(self.documents)
+        avg_length = sum(doc['length'] for doc in self.documents.values()) / total
+        scores = Counter()
+        for term in terms:
+            postings = self.postings.get(term, {})
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for section_id, count in postings.items():
+                length = self.documents[section_id]['length']
+                norm = count + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[section_id] += idf * count * (BM25_K1 + 1) / norm
+        return scores.most_common(limit)
+
+    def results(self, query, limit=10):
+        """Найденные секции: [{'section_id', 'title', 'score', 'snippet'}]"""
+        with self._lock:
+            return [
+                {
+                    'section_id': section_id,
+                    'title': self.documents[section_id]['title'],
+                    'score': round(score, 4),
+                    'snippet': self.snippet(section_id, query),
+                }
+                for section_id, score in self.search(query, limit)
+            ]
+
+    def snippet(self, section_id, query):
+        """Фрагмент текста секции вокруг первого совпадения с запросом"""
+        with self._lock:
+            text = self.documents[section_id]['text']
+        terms = set(tokenize(query))
+        for match in WORD_RE.finditer(text):
+            if normalize_word(match.group()) in terms:
+                start = max(0, match.start() - SNIPPET_RADIUS)
+                end = min(len(text), match.end() + SNIPPET_RADIUS)
+                return ('…' if start else '') + text[start:end] + ('…' if end < len(text) else '')
+        return text[:2 * SNIPPET_RADIUS]
+
+
+# Общий индекс процесса: опубликованные секции (страница теории)
+_index = SearchIndex()
+# Все строки TheorySection, включая неактивные (поиск в админке)
+_all_sections_index = SearchIndex()
+
+
+def get_search_index():
+    """Возвращает индекс, предварительно обновив изменившиеся секции теории"""
+    theory_data = get_theory()
+    titles = {item['id']: item['text'] for item in theory_data['navigation']}
+    _index.update(theory_data['own_sections'], titles, version=theory_data['version'])
+    return _index
+
+
+def search_sections(query, limit=10):
+    """Ищет по секциям теории: [{'section_id', 'title', 'score', 'snippet'}]"""
+    return get_search_index().results(query, limit)
+
+
+def _load_sections(section_ids):
+    return {
+        section_id: (title, content)
+        for section_id, title, content in TheorySection.objects.filter(
+            section_id__in=section_ids).values_list('section_id', 'title', 'content')
+    }
+
+
+def search_all_sections(query, limit=None):
+    """Ищет по всем строкам TheorySection, включая неактивные; возвращает их section_id.
+
+    Версия строки - updated_at: из базы каждый раз читаются только id и
+    updated_at, содержимое - лишь для новых и изменившихся строк.
+    """
+    versions = dict(TheorySection.objects.values_list('section_id', 'updated_at'))
+    _all_sections_index.sync(versions, _load_sections)
+    return [section_id for section_id, _ in _all_sections_index.search(query, limit)]
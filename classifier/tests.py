@@ -1,3 +1,708 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from . import jobs, ml_model, prediction_cache, preprocessing, search, uploads
+from .batching import MicroBatcher
+from .models import (
+    THEORY_GENERATION_CACHE_KEY, TheorySection, get_theory_cache, publish_theory_change,
+)
+from .theory_index import build_index, clear_index, get_db_theory, get_theory, get_theory_path
+from .theory_static import build_theory_static, get_build_version, get_static_root, sync_theory_static
+from .utils import FIXED_NAVIGATION_STRUCTURE, parse_html_to_sections
+
+
+class TheorySectionAdminTests(TestCase):
+    """Список секций в админке: число запросов и массовые операции"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('admin:classifier_theorysection_changelist')
+
+    def create_sections(self, chapters, children_per_chapter=2):
+        order = TheorySection.objects.count()
+        for i in range(chapters):
+            order += 1
+            parent = TheorySection.objects.create(
+                section_id=f'section{order}', title=f'Глава {order}', content='<p>текст</p>',
+                level=1, order=order,
+            )
+            for j in range(children_per_chapter):
+                order += 1
+                TheorySection.objects.create(
+                    section_id=f'section{order}', title=f'Подглава {order}', content='<p>текст</p>',
+                    level=2, order=order, parent=parent,
+                )
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        self.create_sections(2)
+        few = self.changelist_queries()
+        self.create_sections(15)
+        many = self.changelist_queries()
+        self.assertEqual(few, many)
+
+    def test_changelist_query_count(self):
+        # Сессия, пользователь, счетчики пагинатора, секции и фильтры - без запросов на каждую строку
+        self.create_sections(16)
+        with self.assertNumQueries(7):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_children_count_column(self):
+        self.create_sections(1, children_per_chapter=3)
+        response = self.client.get(self.url)
+        self.assertContains(response, '3 подглав(ы)')
+
+    def test_search_finds_inactive_sections_by_content(self):
+        TheorySection.objects.create(
+            section_id='section5-2', title='Архитектуры нейронных сетей', level=1, order=1,
+            content='<p>Классические архитектуры: LeNet, AlexNet, ResNet</p>', is_active=False,
+        )
+        response = self.client.get(self.url, {'q': 'LeNet'})
+        self.assertContains(response, 'section5-2')
+
+    def test_search_loads_content_only_for_changed_sections(self):
+        self.create_sections(3)
+        search.search_all_sections('глава')
+        with patch.object(search, '_load_sections', wraps=search._load_sections) as load_sections:
+            search.search_all_sections('LeNet')
+            load_sections.assert_not_called()
+            section = TheorySection.objects.order_by('pk').first()
+            section.content = '<p>Классические архитектуры: LeNet</p>'
+            section.save()
+            self.assertEqual(search.search_all_sections('LeNet'), [section.section_id])
+            load_sections.assert_called_once_with([section.section_id])
+
+    def changelist_post(self, data):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        return callbacks.count(publish_theory_change), queries
+
+    def test_actions_are_set_based(self):
+        self.create_sections(5)
+        ids = list(TheorySection.objects.values_list('pk', flat=True))
+        selected = {'_selected_action': ids, 'index': 0}
+
+        invalidations, queries = self.changelist_post({**selected, 'action': 'duplicate_sections'})
+        self.assertEqual(invalidations, 1)
+        self.assertEqual(TheorySection.objects.filter(section_id__contains='_copy_').count(), len(ids))
+        self.assertEqual(sum('INSERT' in q['sql'] for q in queries.captured_queries), 1)
+
+        invalidations, queries = self.changelist_post({**selected, 'action': 'make_inactive'})
+        self.assertEqual(invalidations, 1)
+        self.assertFalse(TheorySection.objects.filter(pk__in=ids, is_active=True).exists())
+        self.assertEqual(sum(q['sql'].startswith('UPDATE') for q in queries.captured_queries), 1)
+
+    def test_list_editable_invalidates_cache_once(self):
+        self.create_sections(2)
+        sections = list(TheorySection.objects.order_by('order', 'id'))
+        data = {
+            'form-TOTAL_FORMS': len(sections), 'form-INITIAL_FORMS': len(sections),
+            'form-MIN_NUM_FORMS': 0, 'form-MAX_NUM_FORMS': 1000, '_save': 'Сохранить',
+        }
+        for i, section in enumerate(sections):
+            data[f'form-{i}-id'] = section.pk
+            data[f'form-{i}-order'] = 100 - i
+            data[f'form-{i}-is_active'] = 'on'
+        invalidations, _ = self.changelist_post(data)
+        self.assertEqual(invalidations, 1)
+        self.assertEqual(TheorySection.objects.get(pk=sections[0].pk).order, 100)
+
+
+# Поколение теории в тестах - в памяти, а не в общем файловом кэше
+THEORY_TEST_CACHES = {**settings.CACHES, 'theory': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'theory-tests',
+}}
+
+
+@override_settings(CACHES=THEORY_TEST_CACHES)
+class TheoryCacheTests(TestCase):
+    """Теория из базы кэшируется в процессе до смены общего поколения"""
+
+    def setUp(self):
+        get_theory_cache().clear()
+        self.section = TheorySection.objects.create(
+            section_id='intro', title='Введение', content='<p>старый текст</p>', level=1, order=1,
+        )
+
+    def test_generation_change_from_another_process_rebuilds_theory(self):
+        self.assertEqual(get_db_theory()[1]['sections']['intro'], '<p>старый текст</p>')
+        # Изменение без инвалидации в этом процессе: остается закэшированная версия
+        TheorySection.objects.filter(pk=self.section.pk).update(content='<p>новый текст</p>')
+        self.assertEqual(get_db_theory()[1]['sections']['intro'], '<p>старый текст</p>')
+        # Другой процесс (воркер, import_theory) сменил поколение
+        get_theory_cache().set(THEORY_GENERATION_CACHE_KEY, 'other-process', timeout=None)
+        self.assertEqual(get_db_theory()[1]['sections']['intro'], '<p>новый текст</p>')
+
+    def test_save_publishes_change_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.section.save()
+        self.assertEqual(callbacks, [publish_theory_change])
+
+
+def legacy_build_index(content):
+    """Прежний разбор text.html (до однопроходного split_sections) для сверки"""
+    sections_content = {}
+    container_match = re.search(r'<div[^>]*class=["\']container["\'][^>]*>(.*?)</div>\s*</body>', content, re.DOTALL | re.IGNORECASE)
+    if container_match:
+        content = container_match.group(1)
+        content = re.sub(r'<div[^>]*class=["\']toc["\'][^>]*>.*?</div>', '', content, flags=re.DOTALL | re.IGNORECASE)
+        content = re.sub(r'<hr[^>]*>', '', content, flags=re.IGNORECASE)
+        for prefix in ('Название:', 'Электронное учебное пособие', 'Авторы:', 'Учебное заведение:', 'Год:'):
+            content = re.sub(rf'<p>{prefix}.*?</p>', '', content, flags=re.DOTALL | re.IGNORECASE)
+    else:
+        body_match = re.search(r'<body[^>]*>(.*?)</body>', content, re.DOTALL | re.IGNORECASE)
+        if body_match:
+            content = body_match.group(1)
+            content = re.sub(r'<div[^>]*class=["\']toc["\'][^>]*>.*?</div>', '', content, flags=re.DOTALL | re.IGNORECASE)
+            content = re.sub(r'<hr[^>]*>', '', content, flags=re.IGNORECASE)
+
+    for i, nav_item in enumerate(FIXED_NAVIGATION_STRUCTURE):
+        pattern = rf'<h[12][^>]*id=["\']?{re.escape(nav_item["id"])}["\'][^>]*>.*?</h[12]>'
+        match = re.search(pattern, content, re.DOTALL | re.IGNORECASE)
+        if not match:
+            continue
+        start_pos = match.start()
+        end_pos = len(content)
+        for next_item in FIXED_NAVIGATION_STRUCTURE[i + 1:]:
+            if nav_item['level'] == 1:
+                is_boundary = next_item['level'] == 1
+            else:
+                is_boundary = next_item['level'] == 1 or (
+                    next_item['level'] == 2 and next_item.get('parent') == nav_item.get('parent'))
+            if is_boundary:
+                next_pattern = rf'<h[12][^>]*id=["\']?{re.escape(next_item["id"])}["\'][^>]*>'
+                next_match = re.search(next_pattern, content[start_pos:], re.IGNORECASE)
+                if next_match:
+                    end_pos = start_pos + next_match.start()
+                    break
+        sections_content[nav_item['id']] = content[start_pos:end_pos]
+    return {'content': content, 'sections': sections_content}
+
+
+class TheorySplitTests(SimpleTestCase):
+    """Однопроходный разбор text.html совпадает с прежним"""
+
+    @skipUnless(os.path.exists(get_theory_path()), 'нет text.html')
+    def test_split_matches_legacy_on_text_html(self):
+        with open(get_theory_path(), 'r', encoding='utf-8') as f:
+            content = f.read()
+        expected = legacy_build_index(content)
+        index = build_index(content)
+        self.assertEqual(index['content'], expected['content'])
+        self.assertEqual(index['sections'], expected['sections'])
+        self.assertTrue(index['sections'])
+
+
+class TheoryImportTests(TestCase):
+    """Инкрементальный импорт: пишутся только новые и изменившиеся секции"""
+
+    SECTIONS = [
+        ('intro', 'h1', '<p>Введение в курс</p>'),
+        ('section1', 'h1', '<p>Общая характеристика</p>'),
+        ('section1-1', 'h2', '<p>Определение отходов</p>'),
+        ('section1-2', 'h2', '<p>Классификация отходов</p>'),
+    ]
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'text.html')
+
+    def write_html(self, sections):
+        body = ''.join(f'<{tag} id="{section_id}">{section_id}</{tag}>{html}' for section_id, tag, html in sections)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(f'<html><body><div class="container">{body}</div>\n</body></html>')
+
+    def import_html(self, invalidates=True):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            success, message = parse_html_to_sections(self.path)
+        self.assertTrue(success, message)
+        # Смена поколения теории - единственный on_commit-колбэк импорта
+        self.assertEqual(len(callbacks), int(invalidates))
+        writes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE'))]
+        return message, writes
+
+    def test_reimport_writes_only_changes(self):
+        self.write_html(self.SECTIONS)
+        message, _ = self.import_html()
+        self.assertIn('новых: 4', message)
+        self.assertEqual(TheorySection.objects.get(section_id='section1-2').parent.section_id, 'section1')
+
+        message, writes = self.import_html(invalidates=False)
+        self.assertIn('без изменений: 4', message)
+        self.assertEqual(writes, [])
+
+        edited = [*self.SECTIONS[:3], ('section1-2', 'h2', '<p>Классификация отходов по классам опасности</p>')]
+        self.write_html(edited)
+        message, writes = self.import_html()
+        self.assertIn('изменено: 1', message)
+        self.assertEqual(len(writes), 1)
+        self.assertIn('классам опасности', TheorySection.objects.get(section_id='section1-2').content)
+
+    def test_new_parent_relinks_existing_children(self):
+        self.write_html([self.SECTIONS[0], *self.SECTIONS[2:]])
+        self.import_html()
+        self.assertIsNone(TheorySection.objects.get(section_id='section1-1').parent)
+
+        self.write_html(self.SECTIONS)
+        message, _ = self.import_html()
+        self.assertIn('новых: 1', message)
+        children = TheorySection.objects.filter(section_id__in=['section1-1', 'section1-2'])
+        self.assertEqual({child.parent.section_id for child in children}, {'section1'})
+
+
+@override_settings(CACHES=THEORY_TEST_CACHES)
+class TheoryFragmentTests(TestCase):
+    """Фрагменты секций теории без базы и без text.html"""
+
+    def setUp(self):
+        get_theory_cache().clear()
+
+    @patch('classifier.theory_index.get_theory_path', return_value='/nonexistent/text.html')
+    def test_missing_theory_returns_404(self, _):
+        for url in (reverse('theory_section', args=['intro']), reverse('theory_full')):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(CACHES=THEORY_TEST_CACHES)
+class TheoryStaticTests(TestCase):
+    """Статическая сборка теории устаревает вместе с text.html"""
+
+    def setUp(self):
+        get_theory_cache().clear()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.html_path = os.path.join(tmp_dir.name, 'text.html')
+        self.write_html('<p>первая версия</p>')
+        patcher = patch('classifier.theory_index.get_theory_path', return_value=self.html_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        clear_index()
+        self.addCleanup(clear_index)
+        static_settings = override_settings(CLASSIFIER_THEORY_STATIC_ROOT=os.path.join(tmp_dir.name, 'build'))
+        static_settings.enable()
+        self.addCleanup(static_settings.disable)
+
+    def write_html(self, body, mtime_ns=None):
+        with open(self.html_path, 'w', encoding='utf-8') as f:
+            f.write(f'<html><body><div class="container"><h1 id="intro">Введение</h1>{body}</div>\n</body></html>')
+        if mtime_ns is not None:
+            os.utime(self.html_path, ns=(mtime_ns, mtime_ns))
+
+    def test_rewritten_text_html_clears_stale_build(self):
+        build_theory_static()
+        self.assertEqual(get_build_version(), get_theory()['version'])
+
+        self.write_html('<p>вторая версия</p>', mtime_ns=os.stat(self.html_path).st_mtime_ns + 10**9)
+        get_theory()
+        self.assertFalse(os.path.exists(get_static_root()))
+
+    @override_settings(CLASSIFIER_THEORY_STATIC_AUTOBUILD=True)
+    def test_rewritten_text_html_rebuilds_with_autobuild(self):
+        build_theory_static()
+        self.write_html('<p>вторая версия</p>', mtime_ns=os.stat(self.html_path).st_mtime_ns + 10**9)
+        sync_theory_static()
+        with open(os.path.join(get_static_root(), 'sections', 'intro.html'), encoding='utf-8') as f:
+            self.assertIn('вторая версия', f.read())
+        self.assertEqual(get_build_version(), get_theory()['version'])
+
+
+class UploadStorageTests(SimpleTestCase):
+    """Сохранение загрузок для страницы результата"""
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=tmp_dir.name, CLASSIFIER_UPLOAD_EVICT_INTERVAL=0)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def test_thumbnail_exists_when_url_is_returned(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), 'green').save(buffer, 'JPEG')
+        thumbnail = uploads.save_upload('photo.jpg', buffer.getvalue())
+        self.assertTrue(default_storage.exists(thumbnail))
+        # Повторная загрузка того же фото не создает копий
+        self.assertEqual(uploads.save_upload('photo.jpg', buffer.getvalue()), thumbnail)
+        uploads._executor.submit(lambda: None).result()
+        original, _ = uploads.upload_paths('photo.jpg', buffer.getvalue())
+        self.assertTrue(default_storage.exists(original))
+        self.assertEqual(len(list(uploads._walk(uploads.get_upload_dir()))), 2)
+
+    def test_thumbnail_applies_exif_orientation(self):
+        exif = Image.Exif()
+        exif[preprocessing.EXIF_ORIENTATION] = 6
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), 'green').save(buffer, 'JPEG', exif=exif)
+        with Image.open(io.BytesIO(uploads.make_thumbnail(buffer.getvalue()))) as thumbnail:
+            # Снимок с поворотом на 90° показывается вертикальным
+            self.assertEqual(thumbnail.size, (240, 320))
+
+
+class PreprocessingTests(SimpleTestCase):
+    """Декодирование и нормализация изображений"""
+
+    def test_decode_palette_png_larger_than_reduce_threshold(self):
+        img = Image.new('P', (500, 460))
+        img.putpalette([255, 0, 0] + [0, 0, 0] * 255)
+        buffer = io.BytesIO()
+        img.save(buffer, 'PNG')
+        array = preprocessing.decode_image(buffer.getvalue())
+        self.assertEqual(array.shape, (224, 224, 3))
+        self.assertTrue((array == [255, 0, 0]).all())
+
+    def test_decode_bilevel_and_16bit_images(self):
+        for mode in ('1', 'I;16'):
+            with self.subTest(mode=mode):
+                buffer = io.BytesIO()
+                Image.new(mode, (500, 500)).save(buffer, 'PNG')
+                self.assertEqual(preprocessing.decode_image(buffer.getvalue()).shape, (224, 224, 3))
+
+    def test_normalize_keeps_small_images(self):
+        data = _image_bytes(size=(800, 600), image_format='PNG')
+        self.assertIs(preprocessing.normalize_image(data, max_side=1024), data)
+
+    def test_normalize_downscales_and_keeps_orientation(self):
+        exif = Image.Exif()
+        exif[preprocessing.EXIF_ORIENTATION] = 6
+        buffer = io.BytesIO()
+        Image.new('RGB', (3000, 2000), 'green').save(buffer, 'JPEG', exif=exif)
+        data = preprocessing.normalize_image(buffer.getvalue(), max_side=1024)
+        with Image.open(io.BytesIO(data)) as img:
+            self.assertEqual(img.format, 'JPEG')
+            self.assertEqual(max(img.size), 1024)
+            self.assertEqual(img.getexif().get(preprocessing.EXIF_ORIENTATION), 6)
+
+    def test_normalize_rejects_too_many_pixels(self):
+        data = _image_bytes(size=(100, 100))
+        with self.assertRaises(preprocessing.ImageTooLargeError):
+            preprocessing.normalize_image(data, max_side=1024, max_pixels=100 * 99)
+
+
+@override_settings(CLASSIFIER_SAVE_UPLOADS=False, CLASSIFIER_JOBS_CACHE_ALIAS='default')
+class JobQueueTests(SimpleTestCase):
+    """Ограничение очереди асинхронных задач"""
+
+    def setUp(self):
+        slots = patch.object(jobs, '_queue_slots', threading.BoundedSemaphore(1))
+        slots.start()
+        self.addCleanup(slots.stop)
+
+    def _post_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), 'green').save(buffer, 'JPEG')
+        buffer.name = 'photo.jpg'
+        buffer.seek(0)
+        return self.client.post(reverse('job_create'), {'image': buffer})
+
+    def test_full_queue_returns_503(self):
+        jobs._queue_slots.acquire()
+        response = self._post_image()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertIn('error', response.json())
+
+    def test_slot_is_released_when_job_finishes(self):
+        with patch.object(jobs, 'classify_waste', return_value={'class': 'paper'}):
+            response = self._post_image()
+            self.assertEqual(response.status_code, 202)
+            job_id = response.json()['job_id']
+            # Слот освобождается после записи итогового состояния задачи
+            self.assertTrue(jobs._queue_slots.acquire(timeout=5))
+        self.assertEqual(jobs.get(job_id)['status'], jobs.STATUS_DONE)
+
+
+def _image_bytes(color='green', size=(64, 64), image_format='JPEG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def _fake_predict_batch(batch):
+    # Модель не загружается: всегда уверенно предсказываем первый класс
+    probabilities = np.zeros((len(batch), len(ml_model.CATEGORIES)), dtype=np.float32)
+    probabilities[:, 0] = 0.9
+    probabilities[:, 1] = 0.1
+    return probabilities
+
+
+@override_settings(CLASSIFIER_CACHE_ENABLED=False)
+class ApiClassifyTests(SimpleTestCase):
+    """JSON API пакетной классификации"""
+
+    def setUp(self):
+        predict = patch.object(ml_model, 'predict_batch', side_effect=_fake_predict_batch)
+        self.predict_batch = predict.start()
+        self.addCleanup(predict.stop)
+
+    def _post(self, images=(), archive=None, **data):
+        files = []
+        for name, content in images:
+            upload = io.BytesIO(content)
+            upload.name = name
+            files.append(upload)
+        if files:
+            data['images'] = files
+        if archive is not None:
+            data['archive'] = archive
+        return self.client.post(reverse('api_classify'), data)
+
+    def _zip(self, entries):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name, content in entries:
+                zf.writestr(name, content)
+        buffer.seek(0)
+        buffer.name = 'images.zip'
+        return buffer
+
+    def test_negative_top_k_is_rejected(self):
+        response = self._post([('a.jpg', _image_bytes())], top_k=-1)
+        self.assertEqual(response.status_code, 400)
+        self.predict_batch.assert_not_called()
+
+    def test_top_k_and_per_image_errors(self):
+        response = self._post([('a.jpg', _image_bytes()), ('broken.jpg', b'not an image')], top_k=2)
+        self.assertEqual(response.status_code, 200)
+        ok, broken = response.json()['results']
+        self.assertEqual(ok['class'], ml_model.CATEGORIES[0])
+        self.assertEqual(len(ok['all_predictions']), 2)
+        self.assertEqual(broken['name'], 'broken.jpg')
+        self.assertIn('error', broken)
+
+    @override_settings(CLASSIFIER_API_MAX_IMAGES=2)
+    def test_image_count_limit(self):
+        images = [(f'{i}.jpg', _image_bytes()) for i in range(3)]
+        self.assertEqual(self._post(images).status_code, 400)
+        archive = self._zip(images)
+        self.assertEqual(self._post(archive=archive).status_code, 400)
+        self.predict_batch.assert_not_called()
+
+    def test_image_byte_limits(self):
+        image = _image_bytes()
+        with override_settings(CLASSIFIER_API_MAX_IMAGE_BYTES=len(image) - 1):
+            self.assertEqual(self._post([('a.jpg', image)]).status_code, 400)
+            self.assertEqual(self._post(archive=self._zip([('a.jpg', image)])).status_code, 400)
+        with override_settings(CLASSIFIER_API_MAX_TOTAL_BYTES=len(image) * 2 - 1):
+            self.assertEqual(self._post([('a.jpg', image), ('b.jpg', image)]).status_code, 400)
+            # Сжатый архив проверяется по распакованному размеру
+            bomb = self._zip([('a.png', b'\0' * len(image)), ('b.png', b'\0' * len(image))])
+            self.assertEqual(self._post(archive=bomb).status_code, 400)
+            # Лимит общий для полей images и archive
+            response = self._post([('a.jpg', image)], archive=self._zip([('b.jpg', image)]))
+            self.assertEqual(response.status_code, 400)
+        self.predict_batch.assert_not_called()
+
+
+class SearchIndexTests(SimpleTestCase):
+    """Инкрементальное обновление поискового индекса"""
+
+    def test_unchanged_version_skips_comparison(self):
+        index = search.SearchIndex()
+        self.assertEqual(index.update({'intro': '<p>Сортировка отходов</p>'}, {}, version='db:1'), 1)
+        # Та же версия теории - секции не сравниваются, даже если переданы другие
+        self.assertEqual(index.update({'intro': '<p>Переработка</p>'}, {}, version='db:1'), 0)
+        self.assertEqual(index.search('переработка'), [])
+        self.assertEqual(index.update({'intro': '<p>Переработка</p>'}, {}, version='db:2'), 1)
+        self.assertEqual([section_id for section_id, _ in index.search('переработка')], ['intro'])
+
+
+def legacy_all_predictions(row):
+    """Прежний all_predictions из classify_waste: полный словарь, отсортированный по убыванию"""
+    all_predictions = {}
+    for i in range(len(ml_model.CATEGORIES)):
+        all_predictions[ml_model.CATEGORIES_RU[ml_model.CATEGORIES[i]]] = float(row[i]) * 100
+    return dict(sorted(all_predictions.items(), key=lambda x: x[1], reverse=True))
+
+
+class PredictionFormatTests(SimpleTestCase):
+    """Постобработка матрицы вероятностей совпадает с прежней и учитывает top_k и порог"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        probabilities = rng.dirichlet(np.ones(len(ml_model.CATEGORIES)), size=32).astype(np.float32)
+        # Строка с равными вероятностями: порядок при равенстве как у sorted
+        probabilities[0] = 1 / len(ml_model.CATEGORIES)
+        self.probabilities = probabilities
+
+    def test_matches_legacy_sorted_predictions(self):
+        for row, result in zip(self.probabilities, ml_model.format_predictions(self.probabilities)):
+            expected = legacy_all_predictions(row)
+            self.assertEqual(list(result['all_predictions'].items()), list(expected.items()))
+            predicted_class = ml_model.CATEGORIES[np.argmax(row)]
+            self.assertEqual(result['class'], predicted_class)
+            self.assertEqual(result['confidence'], float(row[np.argmax(row)]) * 100)
+            self.assertEqual(result['waste_bin'], ml_model.WASTE_BINS[predicted_class])
+
+    def test_top_k_indices_match_full_sort(self):
+        full = np.argsort(-self.probabilities, axis=1, kind='stable')
+        for k in (1, 3, len(ml_model.CATEGORIES)):
+            with self.subTest(k=k):
+                np.testing.assert_array_equal(ml_model.top_k_indices(self.probabilities, k), full[:, :k])
+
+    def test_top_k_trims_all_predictions(self):
+        for top_k in (1, 3, 100):
+            with self.subTest(top_k=top_k):
+                results = ml_model.format_predictions(self.probabilities, top_k=top_k)
+                for row, result in zip(self.probabilities, results):
+                    expected = list(legacy_all_predictions(row).items())[:top_k]
+                    self.assertEqual(list(result['all_predictions'].items()), expected)
+
+    def test_uncertain_below_min_confidence(self):
+        probabilities = np.zeros((1, len(ml_model.CATEGORIES)))
+        probabilities[0, :2] = 0.5
+        result, = ml_model.format_predictions(probabilities, min_confidence=60)
+        self.assertTrue(result['uncertain'])
+        self.assertEqual(result['class'], ml_model.UNCERTAIN_CLASS)
+        self.assertEqual(result['confidence'], 50.0)
+        result, = ml_model.format_predictions(probabilities, min_confidence=50)
+        self.assertFalse(result['uncertain'])
+        self.assertEqual(result['class'], ml_model.CATEGORIES[0])
+        # По умолчанию порог берется из settings
+        with override_settings(CLASSIFIER_MIN_CONFIDENCE=60):
+            self.assertTrue(ml_model.format_predictions(probabilities)[0]['uncertain'])
+
+
+class MicroBatcherTests(SimpleTestCase):
+    """Сборка одиночных запросов в пакеты"""
+
+    def make_batcher(self, predict_fn, **kwargs):
+        batcher = MicroBatcher(predict_fn, **kwargs)
+        self.addCleanup(batcher.stop)
+        return batcher
+
+    def test_rows_are_routed_to_their_callers(self):
+        batch_sizes = []
+
+        def predict(batch):
+            batch_sizes.append(len(batch))
+            return batch.reshape(len(batch), -1)[:, :1] * 10
+
+        batcher = self.make_batcher(predict, max_batch_size=4, max_wait_ms=200)
+        futures = [batcher.submit(np.full((2, 2), i, dtype=np.float32)) for i in range(10)]
+        self.assertEqual([future.result(timeout=5)[0] for future in futures], [i * 10 for i in range(10)])
+        self.assertEqual(sum(batch_sizes), 10)
+        self.assertLessEqual(max(batch_sizes), 4)
+        self.assertGreater(max(batch_sizes), 1)
+
+    def test_errors_reach_every_caller_in_the_batch(self):
+        calls = []
+
+        def predict(batch):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                raise RuntimeError('модель недоступна')
+            return batch
+
+        batcher = self.make_batcher(predict, max_batch_size=4, max_wait_ms=200)
+        futures = [batcher.submit(np.zeros(3)) for _ in range(3)]
+        for future in futures:
+            with self.assertRaisesMessage(RuntimeError, 'модель недоступна'):
+                future.result(timeout=5)
+        # После ошибки пакета батчер продолжает работать
+        np.testing.assert_array_equal(batcher.predict(np.ones(3), timeout=5), np.ones(3))
+
+
+@override_settings(
+    CLASSIFIER_CACHE_ENABLED=True, CLASSIFIER_CACHE_ALIAS='predictions',
+    CACHES={**settings.CACHES, 'predictions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'classifier-tests-predictions',
+    }},
+)
+class PredictionCacheTests(SimpleTestCase):
+    """Повторное изображение берется из кэша предсказаний без вызова модели"""
+
+    def setUp(self):
+        prediction_cache.get_cache().clear()
+        for patcher in (patch.object(prediction_cache, '_model_version', 'test'),
+                        patch.object(ml_model, 'predict_batch', side_effect=_fake_predict_batch)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.predict_batch = ml_model.predict_batch
+
+    def test_hit_skips_model_and_applies_top_k(self):
+        image = _image_bytes()
+        first, = ml_model.classify_batch([image])
+        self.assertEqual(self.predict_batch.call_count, 1)
+        self.assertEqual(prediction_cache.get_stats(), {'hits': 0, 'misses': 1, 'hit_rate': 0.0})
+
+        cached, = ml_model.classify_batch([image], top_k=2)
+        self.assertEqual(self.predict_batch.call_count, 1)
+        self.assertEqual(prediction_cache.get_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+        self.assertEqual(cached['all_predictions'], dict(list(first['all_predictions'].items())[:2]))
+
+    def test_other_image_misses(self):
+        ml_model.classify_batch([_image_bytes('green')])
+        ml_model.classify_batch([_image_bytes('red')])
+        self.assertEqual(self.predict_batch.call_count, 2)
+        self.assertEqual(prediction_cache.get_stats()['misses'], 2)
+
+
+class TextConverterTests(SimpleTestCase):
+    """txt_to_html_v2: потоковый конвертер выдает тот же HTML, что и прежний"""
+
+    SOURCE = os.path.join(settings.BASE_DIR, 'text_extracted.txt')
+    # SHA-256 text_extracted.txt и HTML, который построил из него прежний
+    # конвертер (create_html_document до потоковой версии)
+    SOURCE_SHA256 = '4a18a7df1a4898449828bee035f406f2cb051763a42ae96a469c5a1d285b400c'
+    LEGACY_HTML_SHA256 = 'f09ea31d161b0a44ead83f60d636f811dac9e31e8167e0d6e8329a190b6c4fc0'
+
+    def setUp(self):
+        if not os.path.exists(self.SOURCE):
+            self.skipTest('нет text_extracted.txt')
+        with open(self.SOURCE, 'rb') as f:
+            if hashlib.sha256(f.read()).hexdigest() != self.SOURCE_SHA256:
+                self.skipTest('text_extracted.txt изменен: эталон прежнего конвертера не подходит')
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.output = os.path.join(tmp_dir.name, 'text.html')
+
+    def convert(self, cache_file=None):
+        import txt_to_html_v2
+        _, rendered, written = txt_to_html_v2.write_html_document(
+            txt_to_html_v2.read_lines(self.SOURCE), self.output, cache_file)
+        with open(self.output, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest(), rendered, written
+
+    def test_output_matches_legacy_converter(self):
+        digest, _, written = self.convert()
+        self.assertTrue(written)
+        self.assertEqual(digest, self.LEGACY_HTML_SHA256)
+
+    def test_incremental_output_matches_and_skips_unchanged(self):
+        cache_file = f'{self.output}.cache.json'
+        digest, rendered, _ = self.convert(cache_file)
+        self.assertEqual(digest, self.LEGACY_HTML_SHA256)
+        self.assertGreater(rendered, 0)
+        digest, rendered, written = self.convert(cache_file)
+        self.assertEqual((digest, rendered, written), (self.LEGACY_HTML_SHA256, 0, False))
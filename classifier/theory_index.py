@@ -0,0 +1,249 @@
+"""
+Индекс разделов теории: text.html разбирается на фрагменты один раз
+и пересобирается только при изменении файла
+"""
+import os
+import re
+import threading
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .models import TheorySection, get_theory_generation
+from .utils import FIXED_NAVIGATION_STRUCTURE
+
+# Кэш индекса в памяти процесса: (версия файла, индекс)
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+# Теория из базы в памяти процесса: (поколение, навигация, секции)
+_db_theory = None
+
+
+def get_theory_path():
+    return os.path.join(settings.BASE_DIR, 'text.html')
+
+
+# Контейнер с текстом учебника (вывод txt_to_html_v2.py) или, если его нет, body
+CONTAINER_RE = re.compile(r'<div[^>]*class=["\']container["\'][^>]*>(.*?)</div>\s*</body>', re.DOTALL | re.IGNORECASE)
+BODY_RE = re.compile(r'<body[^>]*>(.*?)</body>', re.DOTALL | re.IGNORECASE)
+
+# Все вычищаемые фрагменты одним проходом: оглавление (toc, у нас есть sidebar
+# навигация), hr после него и мета-информация (название, авторы и т.д.) до первого h1
+_TOC = r'<div[^>]*class=["\']toc["\'][^>]*>.*?</div>'
+_HR = r'<hr[^>]*>'
+_META = r'<p>(?:Название:|Электронное учебное пособие|Авторы:|Учебное заведение:|Год:).*?</p>'
+CONTAINER_CLEANUP_RE = re.compile('|'.join((_TOC, _HR, _META)), re.DOTALL | re.IGNORECASE)
+BODY_CLEANUP_RE = re.compile('|'.join((_TOC, _HR)), re.DOTALL | re.IGNORECASE)
+
+# Открывающий тег заголовка h1/h2 с id
+HEADING_RE = re.compile(r'<h[12][^>]*id=["\']?([^"\'\s>]+)["\'][^>]*>', re.IGNORECASE)
+
+
+def extract_body(content):
+    """Возвращает очищенное тело учебника из полного HTML-документа"""
+    container_match = CONTAINER_RE.search(content)
+    if container_match:
+        return CONTAINER_CLEANUP_RE.sub('', container_match.group(1))
+    body_match = BODY_RE.search(content)
+    if body_match:
+        return BODY_CLEANUP_RE.sub('', body_match.group(1))
+    return content
+
+
+def split_sections(content, navigation=FIXED_NAVIGATION_STRUCTURE):
+    """Делит тело на фрагменты секций за один проход по документу.
+
+    Секция уровня 1 продолжается до следующей секции уровня 1, секция уровня 2 -
+    до следующей секции уровня 2 того же родителя или следующей секции уровня 1.
+    Секции в документе идут в порядке navigation.
+    """
+    # Один проход: смещение первого заголовка с каждым id
+    positions = {}
+    for match in HEADING_RE.finditer(content):
+        positions.setdefault(match.group(1), match.start())
+
+    # Обратный проход по навигации: ближайшие следующие границы уже известны
+    bounds = {}
+    next_level1 = None
+    next_sibling = {}
+    for nav_item in reversed(navigation):
+        section_id = nav_item['id']
+        start_pos = positions.get(section_id)
+        if nav_item['level'] == 1:
+            candidates = (next_level1,)
+        else:
+            candidates = (next_sibling.get(nav_item.get('parent')), next_level1)
+        if start_pos is not None:
+            following = [pos for pos in candidates if pos is not None and pos > start_pos]
+            bounds[section_id] = (start_pos, min(following, default=len(content)))
+            if nav_item['level'] == 1:
+                next_level1 = start_pos
+            else:
+                next_sibling[nav_item.get('parent')] = start_pos
+
+    return {
+        nav_item['id']: content[slice(*bounds[nav_item['id']])]
+        for nav_item in navigation if nav_item['id'] in bounds
+    }
+
+
+def split_own_sections(content, navigation=FIXED_NAVIGATION_STRUCTURE):
+    """Собственное содержимое каждой секции: от ее заголовка до заголовка
+    следующей секции навигации (без подглав). Используется при импорте в базу."""
+    positions = {}
+    for match in HEADING_RE.finditer(content):
+        positions.setdefault(match.group(1), match.start())
+    starts = sorted(positions[nav_item['id']] for nav_item in navigation if nav_item['id'] in positions)
+    next_start = dict(zip(starts, starts[1:] + [len(content)]))
+    return {
+        nav_item['id']: content[positions[nav_item['id']]:next_start[positions[nav_item['id']]]]
+        for nav_item in navigation if nav_item['id'] in positions
+    }
+
+
+def build_index(content):
+    """Разбирает HTML учебника: возвращает {'content': тело, 'sections': {id секции: HTML},
+    'own_sections': {id секции: HTML без подглав}}"""
+    if not content:
+        return {'content': content, 'sections': {}, 'own_sections': {}}
+    content = extract_body(content)
+    return {'content': content, 'sections': split_sections(content), 'own_sections': split_own_sections(content)}
+
+
+def get_theory_index():
+    """Возвращает индекс разделов text.html, пересобирая его только при изменении файла.
+
+    Версия файла - (mtime_ns, размер): одного os.stat на запрос достаточно,
+    чтобы заметить перезапись файла конвертером.
+    """
+    global _index, _index_version
+    html_file_path = get_theory_path()
+    stat = os.stat(html_file_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    if _index is None or _index_version != version:
+        with _index_lock:
+            rebuilt = _index is None or _index_version != version
+            if rebuilt:
+                # Читаем файл в UTF-8 (text.html использует UTF-8)
+                with open(html_file_path, 'r', encoding='utf-8') as f:
+                    index = build_index(f.read())
+                index['updated_at'] = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+                index['version'] = f'file:{stat.st_mtime_ns}:{stat.st_size}'
+                _index = index
+                _index_version = version
+        if rebuilt:
+            # Файл перезаписан (или процесс только запущен): статическая сборка,
+            # собранная из другой версии, устарела
+            from .theory_static import sync_theory_static
+            sync_theory_static(_index['version'])
+    return _index
+
+
+def clear_index():
+    """Сбрасывает индекс (следующий запрос пересоберет его)"""
+    global _index, _index_version
+    with _index_lock:
+        _index = None
+        _index_version = None
+
+
+def build_db_theory(rows):
+    """Собирает навигацию и фрагменты секций из строк TheorySection.
+
+    Фрагмент главы (уровень 1) - ее собственное содержимое и содержимое всех
+    подглав, как при разборе text.html. Подглавы неактивной главы не показываются.
+    """
+    children = {}
+    for row in rows:
+        if row.parent_id is not None:
+            children.setdefault(row.parent_id, []).append(row)
+
+    navigation = []
+    sections = {}
+    parts = []
+    updated_at = max((row.updated_at for row in rows), default=None)
+    for row in rows:
+        if row.parent_id is not None:
+            continue
+        navigation.append({'id': row.section_id, 'text': row.title, 'level': 1, 'order': row.order})
+        chapter = [row.content]
+        for child in children.get(row.pk, []):
+            navigation.append({'id': child.section_id, 'text': child.title, 'level': 2,
+                               'order': child.order, 'parent': row.section_id})
+            sections[child.section_id] = child.content
+            chapter.append(child.content)
+        sections[row.section_id] = ''.join(chapter)
+        parts.append(sections[row.section_id])
+    own_sections = {row.section_id: row.content for row in rows}
+    return navigation, {'content': ''.join(parts), 'sections': sections,
+                        'own_sections': own_sections, 'updated_at': updated_at}
+
+
+def get_db_theory():
+    """Навигация и секции из таблицы TheorySection.
+
+    Собранное дерево хранится в памяти процесса, пока не сменится поколение
+    в общем кэше: его меняет invalidate_theory_cache() в любом процессе
+    (сохранение в админке, импорт). Возвращает (navigation, {'content', 'sections'});
+    пустая навигация означает, что секций в базе нет.
+    """
+    global _db_theory
+    generation = get_theory_generation()
+    cached = _db_theory
+    if cached is not None and cached[0] == generation:
+        return cached[1], cached[2]
+    # Одним запросом: все активные секции, дерево собирается в Python
+    rows = list(
+        TheorySection.objects.filter(is_active=True)
+        .only('id', 'section_id', 'title', 'content', 'level', 'order', 'parent_id', 'updated_at')
+        .order_by('order', 'id')
+    )
+    navigation, theory = build_db_theory(rows)
+    theory['version'] = f'db:{generation}'
+    _db_theory = (generation, navigation, theory)
+    return navigation, theory
+
+
+def get_theory():
+    """Содержимое страницы теории: из базы, а если секций там нет - из text.html.
+
+    Возвращает {'navigation', 'content', 'sections', 'own_sections', 'updated_at', 'version'};
+    version - версия источника (поколение базы или mtime и размер text.html).
+    """
+    try:
+        navigation, theory = get_db_theory()
+    except DatabaseError:
+        # Миграции еще не применены - работаем с файлом
+        navigation = None
+    if navigation:
+        return {'navigation': navigation, **theory}
+    return {'navigation': FIXED_NAVIGATION_STRUCTURE, **get_theory_index()}
+
+
+def get_theory_page_context():
+    """Контекст шаблона theory.html: навигация и первая секция (остальные
+    подгружаются страницей по требованию)"""
+    error_message = ""
+    sections_content = {}
+    navigation = FIXED_NAVIGATION_STRUCTURE
+    
+    try:
+        # Секции берутся из кэша; разбор и запросы к базе - только после изменений
+        theory_data = get_theory()
+        navigation = theory_data['navigation']
+        first_id = next((item['id'] for item in navigation if item['id'] in theory_data['sections']), None)
+        if first_id:
+            sections_content = {first_id: theory_data['sections'][first_id]}
+    except FileNotFoundError:
+        error_message = f"Файл text.html не найден в корне проекта: {settings.BASE_DIR}"
+    except Exception as e:
+        error_message = f"Ошибка чтения файла: {str(e)}"
+    
+    return {
+        'sections_content': sections_content,
+        'error_message': error_message,
+        'navigation': navigation,
+    }
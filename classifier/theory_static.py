@@ -0,0 +1,117 @@
+"""
+Статическая сборка страницы теории для отдачи напрямую через nginx
+
+Каталог CLASSIFIER_THEORY_STATIC_ROOT:
+    index.html            - страница /theory/
+    full.html             - фрагмент /theory/full/
+    sections/<id>.html    - фрагменты /theory/sections/<id>/
+    .source-version       - версия источника, из которой сделана сборка
+и рядом с каждым файлом сжатые .gz и (если установлен brotli) .br варианты.
+Если сборки нет, nginx передает запрос в Django. Сборка из устаревшей версии
+(изменились секции в базе или text.html) удаляется или пересобирается.
+"""
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from .theory_index import get_theory, get_theory_page_context
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость
+    brotli = None
+
+SOURCE_VERSION_FILE = '.source-version'
+
+
+def get_static_root():
+    return str(getattr(settings, 'CLASSIFIER_THEORY_STATIC_ROOT', os.path.join(settings.BASE_DIR, 'theory_build')))
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def _write_variants(path, html):
+    """Пишет HTML и его сжатые варианты; возвращает список записанных файлов"""
+    data = html.encode('utf-8')
+    written = [path]
+    _write_atomic(path, data)
+    _write_atomic(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    written.append(path + '.gz')
+    if brotli is not None:
+        _write_atomic(path + '.br', brotli.compress(data, mode=brotli.MODE_TEXT))
+        written.append(path + '.br')
+    return written
+
+
+def build_theory_static():
+    """Рендерит страницу и все фрагменты теории в CLASSIFIER_THEORY_STATIC_ROOT.
+
+    Возвращает количество записанных файлов (с учетом сжатых вариантов).
+    """
+    root = get_static_root()
+    theory_data = get_theory()
+    written = []
+    written += _write_variants(os.path.join(root, 'index.html'),
+                               render_to_string('classifier/theory.html', get_theory_page_context()))
+    written += _write_variants(os.path.join(root, 'full.html'), theory_data['content'])
+    for section_id, html in theory_data['sections'].items():
+        written += _write_variants(os.path.join(root, 'sections', f'{section_id}.html'), html)
+
+    # Удаляем фрагменты секций, которых больше нет
+    sections_dir = os.path.join(root, 'sections')
+    keep = set(written)
+    for name in os.listdir(sections_dir):
+        path = os.path.join(sections_dir, name)
+        if path not in keep:
+            os.remove(path)
+    # Версия пишется последней: сборка без нее считается устаревшей
+    _write_atomic(os.path.join(root, SOURCE_VERSION_FILE), theory_data['version'].encode('utf-8'))
+    return len(written)
+
+
+def clear_theory_static():
+    """Удаляет сборку: пока ее нет, страницу отдает Django"""
+    shutil.rmtree(get_static_root(), ignore_errors=True)
+
+
+def refresh_theory_static():
+    """Вызывается при изменении теории: устаревшую сборку убираем сразу,
+    новую собираем, если включена CLASSIFIER_THEORY_STATIC_AUTOBUILD"""
+    root = get_static_root()
+    if getattr(settings, 'CLASSIFIER_THEORY_STATIC_AUTOBUILD', False):
+        build_theory_static()
+    elif os.path.exists(root):
+        clear_theory_static()
+
+
+def get_build_version():
+    """Версия источника, из которой сделана сборка, или None"""
+    try:
+        with open(os.path.join(get_static_root(), SOURCE_VERSION_FILE), 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def sync_theory_static(version=None):
+    """Обновляет сборку, если она есть и сделана из другой версии источника
+    (по умолчанию - текущей версии get_theory()). Нужна, когда источник
+    изменился в обход invalidate_theory_cache: например, перезаписан text.html"""
+    if not os.path.isdir(get_static_root()):
+        return
+    if version is None:
+        version = get_theory()['version']
+    if get_build_version() != version:
+        refresh_theory_static()
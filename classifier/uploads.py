@@ -0,0 +1,189 @@
+"""
+Нормализация загруженных изображений и их сохранение вне пути запроса
+
+Загрузки хранятся по содержимому: имя файла - SHA-256 данных, поэтому
+повторная загрузка того же фото не создает копию. Для страницы результата
+рядом сохраняется маленькая WebP-миниатюра: она пишется сразу, до ответа,
+а оригинал - в фоне. Каталог загрузок держится в пределах бюджета по размеру
+и возрасту (evict_uploads: команда evict_uploads и периодическая очистка в
+отдельном фоновом потоке).
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .preprocessing import normalize_image
+
+# Один поток: запись оригиналов на диск не должна конкурировать с инференсом
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload-save')
+# Очистка обходит весь каталог загрузок, поэтому идет в своем потоке и не
+# задерживает запись
+_evict_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload-evict')
+
+# Расширения файлов по формату изображения
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp', 'BMP': '.bmp'}
+THUMBNAILS_DIR = 'thumbs'
+
+# Время последней фоновой очистки каталога загрузок (time.monotonic())
+_last_eviction = None
+_eviction_lock = threading.Lock()
+
+
+def normalize_upload(data):
+    """Уменьшает слишком большие загрузки до классификации и сохранения
+    (см. CLASSIFIER_UPLOAD_* в settings.py)"""
+    return normalize_image(
+        data,
+        max_side=getattr(settings, 'CLASSIFIER_UPLOAD_MAX_SIDE', 1024),
+        max_pixels=getattr(settings, 'CLASSIFIER_UPLOAD_MAX_PIXELS', 40_000_000),
+        quality=getattr(settings, 'CLASSIFIER_UPLOAD_JPEG_QUALITY', 90),
+    )
+
+
+def get_upload_dir():
+    return getattr(settings, 'CLASSIFIER_UPLOAD_DIR', 'uploads')
+
+
+def _image_extension(name, data):
+    """Расширение по формату из заголовка изображения (имя загрузки может врать)"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            extension = FORMAT_EXTENSIONS.get(img.format)
+    except Exception:
+        extension = None
+    return extension or os.path.splitext(name)[1].lower()
+
+
+def _thumbnail_format():
+    return ('WEBP', '.webp') if features.check('webp') else ('JPEG', '.jpg')
+
+
+def upload_paths(name, data):
+    """Имена оригинала и миниатюры в хранилище: <dir>/ab/<sha256>.jpg и <dir>/thumbs/ab/<sha256>.webp"""
+    digest = hashlib.sha256(data).hexdigest()
+    upload_dir = get_upload_dir()
+    original = f'{upload_dir}/{digest[:2]}/{digest}{_image_extension(name, data)}'
+    thumbnail = f'{upload_dir}/{THUMBNAILS_DIR}/{digest[:2]}/{digest}{_thumbnail_format()[1]}'
+    return original, thumbnail
+
+
+def make_thumbnail(data):
+    """Миниатюра для страницы результата (WebP, если Pillow его поддерживает)"""
+    size = getattr(settings, 'CLASSIFIER_UPLOAD_THUMBNAIL_SIZE', 320)
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft('RGB', (size, size))
+        img = img.convert('RGB')
+        img.thumbnail((size, size), Image.BILINEAR)
+        # Миниатюра сохраняется без EXIF: поворачиваем по ориентации снимка.
+        # После уменьшения - поворот маленького изображения дешевле
+        img = ImageOps.exif_transpose(img)
+        buffer = io.BytesIO()
+        img.save(buffer, _thumbnail_format()[0], quality=80)
+    return buffer.getvalue()
+
+
+def _touch(name):
+    """Обновляет время изменения файла, чтобы очистка считала его свежим"""
+    try:
+        os.utime(default_storage.path(name))
+    except (NotImplementedError, OSError):
+        pass
+
+
+def _store(name, make_data):
+    """Сохраняет файл под именем-хэшем; уже сохраненный только помечает свежим"""
+    if default_storage.exists(name):
+        _touch(name)
+        return
+    saved_name = default_storage.save(name, ContentFile(make_data()))
+    if saved_name != name:
+        # Тот же файл одновременно сохранил другой запрос: хранилище дало копии
+        # другое имя, она не нужна
+        default_storage.delete(saved_name)
+
+
+def save_upload(name, data):
+    """Сохраняет загрузку для страницы результата; возвращает имя миниатюры в хранилище.
+
+    Миниатюра маленькая и нужна ответу, поэтому пишется сразу; оригинал
+    сохраняется в фоне.
+    """
+    original, thumbnail = upload_paths(name, data)
+    _store(thumbnail, lambda: make_thumbnail(data))
+    _executor.submit(_store, original, lambda: data)
+    _maybe_evict()
+    return thumbnail
+
+
+def _walk(path):
+    """Все файлы каталога хранилища (рекурсивно)"""
+    try:
+        directories, files = default_storage.listdir(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for file_name in files:
+        yield f'{path}/{file_name}'
+    for directory in directories:
+        yield from _walk(f'{path}/{directory}')
+
+
+def evict_uploads(max_bytes=None, max_age_days=None):
+    """Удаляет загрузки старше max_age_days и самые старые сверх max_bytes.
+
+    Оригинал и миниатюра (одно имя-хэш) удаляются вместе. По умолчанию
+    бюджет берется из CLASSIFIER_UPLOAD_MAX_BYTES и CLASSIFIER_UPLOAD_MAX_AGE_DAYS.
+    Возвращает (удалено загрузок, освобождено байт, осталось байт).
+    """
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'CLASSIFIER_UPLOAD_MAX_BYTES', 500 * 1024 * 1024)
+    if max_age_days is None:
+        max_age_days = getattr(settings, 'CLASSIFIER_UPLOAD_MAX_AGE_DAYS', 30)
+
+    # Группируем файлы по хэшу: {хэш: [время, размер, [имена]]}
+    uploads = {}
+    for name in _walk(get_upload_dir()):
+        digest = os.path.splitext(os.path.basename(name))[0]
+        entry = uploads.setdefault(digest, [None, 0, []])
+        modified = default_storage.get_modified_time(name)
+        entry[0] = modified if entry[0] is None else max(entry[0], modified)
+        entry[1] += default_storage.size(name)
+        entry[2].append(name)
+
+    total = sum(entry[1] for entry in uploads.values())
+    cutoff = timezone.now() - timedelta(days=max_age_days) if max_age_days else None
+    deleted = freed = 0
+    for modified, size, names in sorted(uploads.values(), key=lambda entry: entry[0]):
+        expired = cutoff is not None and modified < cutoff
+        over_budget = bool(max_bytes) and total - freed > max_bytes
+        if not expired and not over_budget:
+            # Записи отсортированы по возрасту: дальше только более свежие
+            break
+        for name in names:
+            default_storage.delete(name)
+        deleted += 1
+        freed += size
+    return deleted, freed, total - freed
+
+
+def _maybe_evict():
+    """Запускает фоновую очистку не чаще раза в CLASSIFIER_UPLOAD_EVICT_INTERVAL секунд"""
+    global _last_eviction
+    interval = getattr(settings, 'CLASSIFIER_UPLOAD_EVICT_INTERVAL', 3600)
+    if not interval:
+        return
+    with _eviction_lock:
+        now = time.monotonic()
+        if _last_eviction is not None and now - _last_eviction < interval:
+            return
+        _last_eviction = now
+    _evict_executor.submit(evict_uploads)
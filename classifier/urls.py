@@ -4,7 +4,17 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('practice/', views.practice, name='practice'),
+    path('practice/jobs/', views.job_create, name='job_create'),
+    path('practice/jobs/<str:job_id>/', views.job_status, name='job_status'),
+    path('practice/jobs/<str:job_id>/events/', views.job_events, name='job_events'),
     path('theory/', views.theory, name='theory'),
+    path('theory/full/', views.theory_section, name='theory_full'),
+    path('theory/sections/<str:section_id>/', views.theory_section, name='theory_section'),
+    path('theory/search/', views.theory_search, name='theory_search'),
+    path('api/classify/', views.api_classify, name='api_classify'),
+    path('ready/', views.ready, name='ready'),
+    path('stats/cache/', views.cache_stats, name='cache_stats'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
 
 
@@ -1,6 +1,8 @@
 """
 Утилиты для работы с теорией
 """
+import hashlib
+import os
 
 # Фиксированная структура навигации (не редактируется через админ)
 FIXED_NAVIGATION_STRUCTURE = [
@@ -34,3 +36,89 @@ FIXED_NAVIGATION_STRUCTURE = [
     {'id': 'section5-4', 'text': 'Пример: автоматическая классификация бытовых отходов', 'level': 2, 'order': 28, 'parent': 'section5'},
     {'id': 'bibliography', 'text': 'Список литературы', 'level': 1, 'order': 29},
 ]
+
+
+def _section_hash(title, content, level, order, parent_section_id):
+    """Хэш полей секции для сравнения с уже сохраненной строкой"""
+    data = '\x00'.join([title, content, str(level), str(order), parent_section_id or ''])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def parse_html_to_sections(html_file_path=None):
+    """Импортирует text.html (или вывод txt_to_html_v2.py) в TheorySection.
+
+    Секции сопоставляются с существующими строками по section_id и хэшу
+    содержимого: записываются только новые и изменившиеся (bulk_create /
+    bulk_update в одной транзакции), кэш теории сбрасывается один раз.
+    Возвращает (успех, сообщение).
+    """
+    from django.conf import settings
+    from django.db import transaction
+    from django.utils import timezone
+
+    from .models import TheorySection, invalidate_theory_cache
+    from .theory_index import extract_body, split_own_sections
+
+    html_file_path = html_file_path or os.path.join(settings.BASE_DIR, 'text.html')
+    if not os.path.exists(html_file_path):
+        return False, f'Файл не найден: {html_file_path}'
+    with open(html_file_path, 'r', encoding='utf-8') as f:
+        fragments = split_own_sections(extract_body(f.read()))
+    if not fragments:
+        return False, f'В файле {html_file_path} не найдено ни одной секции навигации'
+
+    wanted = {}
+    for nav_item in FIXED_NAVIGATION_STRUCTURE:
+        if nav_item['id'] in fragments:
+            wanted[nav_item['id']] = {
+                'title': nav_item['text'],
+                'content': fragments[nav_item['id']],
+                'level': nav_item['level'],
+                'order': nav_item['order'],
+                'parent': nav_item.get('parent'),
+            }
+
+    with transaction.atomic():
+        existing = {
+            row['section_id']: row
+            for row in TheorySection.objects.filter(section_id__in=wanted).values(
+                'id', 'section_id', 'title', 'content', 'level', 'order', 'parent__section_id')
+        }
+        now = timezone.now()
+        new_rows = [
+            TheorySection(section_id=section_id, title=data['title'], content=data['content'],
+                          level=data['level'], order=data['order'])
+            for section_id, data in wanted.items() if section_id not in existing
+        ]
+        TheorySection.objects.bulk_create(new_rows)
+
+        # id всех секций (и новых, и родителей, которые уже были в базе)
+        ids = dict(TheorySection.objects.filter(
+            section_id__in=set(wanted) | {data['parent'] for data in wanted.values() if data['parent']}
+        ).values_list('section_id', 'id'))
+
+        created = {row.section_id for row in new_rows}
+        changed = []
+        for section_id, data in wanted.items():
+            row = existing.get(section_id)
+            if row is not None and _section_hash(
+                    row['title'], row['content'], row['level'], row['order'], row['parent__section_id']
+            ) == _section_hash(data['title'], data['content'], data['level'], data['order'], data['parent']):
+                continue
+            if section_id in created and not data['parent']:
+                continue
+            changed.append(TheorySection(
+                id=ids[section_id], section_id=section_id, title=data['title'], content=data['content'],
+                level=data['level'], order=data['order'], parent_id=ids.get(data['parent']), updated_at=now,
+            ))
+        TheorySection.objects.bulk_update(
+            changed, ['title', 'content', 'level', 'order', 'parent', 'updated_at'], batch_size=100)
+
+    # Повторный импорт без изменений не сбрасывает кэши теории во всех воркерах
+    if created or changed:
+        invalidate_theory_cache()
+
+    updated = len([row for row in changed if row.section_id not in created])
+    unchanged = len(wanted) - len(created) - updated
+    return True, (f'Импортировано секций: {len(wanted)} '
+                  f'(новых: {len(created)}, изменено: {updated}, без изменений: {unchanged})')
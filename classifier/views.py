@@ -1,10 +1,20 @@
-import os
-import re
+import hashlib
+import json
+import time
+import zipfile
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET, require_POST
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from django.conf import settings
-from .ml_model import classify_waste
+from . import jobs, metrics, prediction_cache
+from .search import search_sections
+from .ml_model import classify_batch, classify_waste, get_warmup_status
+from .theory_index import get_theory, get_theory_page_context
+from .uploads import normalize_upload, save_upload
 
 def index(request):
     """Главная страница"""
@@ -17,125 +27,288 @@ def index(request):
     }
     return render(request, 'classifier/index.html', context)
 
+def ready(request):
+    """Проверка готовности: OK только после прогрева модели"""
+    is_ready, error = get_warmup_status()
+    if error is not None:
+        return HttpResponse(f"Ошибка прогрева модели: {error}", status=503, content_type='text/plain; charset=utf-8')
+    if not is_ready:
+        return HttpResponse("Модель прогревается", status=503, content_type='text/plain; charset=utf-8')
+    return HttpResponse("OK", content_type='text/plain; charset=utf-8')
+
+def cache_stats(request):
+    """Счетчики попаданий и промахов кэша предсказаний"""
+    return JsonResponse(prediction_cache.get_stats())
+
+@require_GET
+def metrics_view(request):
+    """Метрики всех воркеров в текстовом формате Prometheus"""
+    if not metrics.is_enabled():
+        raise Http404("Метрики выключены")
+    return HttpResponse(metrics.render_prometheus(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _save_for_display(uploaded_file, image_data):
+    """Сохраняет загрузку для показа на странице результата; возвращает URL миниатюры или None"""
+    if not getattr(settings, 'CLASSIFIER_SAVE_UPLOADS', True):
+        return None
+    file_name = save_upload(uploaded_file.name, image_data)
+    return default_storage.url(file_name)
+
 def practice(request):
     """Страница практики машинного обучения - загрузка и классификация изображений"""
     result = None
     error = None
     uploaded_image_url = None
     
-    if request.method == 'POST' and 'image' in request.FILES:
+    # Разбор multipart-тела - это время загрузки файла
+    with metrics.timer('upload'):
+        has_upload = request.method == 'POST' and 'image' in request.FILES
+    
+    if has_upload:
         try:
             uploaded_file = request.FILES['image']
+            image_data = uploaded_file.read()
+            # Большие фото уменьшаем до классификации и сохранения
+            with metrics.timer('normalize'):
+                image_data = normalize_upload(image_data)
             
-            # Сохраняем файл
-            file_name = default_storage.save(uploaded_file.name, ContentFile(uploaded_file.read()))
-            file_path = os.path.join(settings.MEDIA_ROOT, file_name)
-            
-            # Классифицируем изображение
-            result = classify_waste(file_path)
-            uploaded_image_url = f'/media/{file_name}'
+            # Классифицируем изображение прямо из памяти
+            result = classify_waste(image_data)
             
-            # Удаляем файл после обработки (опционально, можно оставить для отображения)
-            # default_storage.delete(file_name)
+            # Сохраняем миниатюру для отображения (оригинал - в фоне, опционально)
+            with metrics.timer('save'):
+                uploaded_image_url = _save_for_display(uploaded_file, image_data)
             
         except Exception as e:
             error = f"Ошибка при обработке изображения: {str(e)}"
-            if 'file_path' in locals() and os.path.exists(file_path):
-                default_storage.delete(file_name)
+    
+    elif 'job' in request.GET:
+        # Результат асинхронной задачи (страница открывается скриптом после опроса)
+        job = jobs.get(request.GET['job'])
+        if job is None:
+            error = "Задача не найдена или ее результат устарел. Загрузите изображение еще раз."
+        elif job['status'] == jobs.STATUS_DONE:
+            result = job['result']
+            uploaded_image_url = job.get('image_url')
+        elif job['status'] == jobs.STATUS_ERROR:
+            error = job['error']
+        else:
+            error = "Классификация еще выполняется. Обновите страницу через несколько секунд."
     
     context = {
         'result': result,
         'error': error,
         'uploaded_image_url': uploaded_image_url,
+        'async_jobs': getattr(settings, 'CLASSIFIER_ASYNC_JOBS_ENABLED', True),
+        'job_poll_timeout': getattr(settings, 'CLASSIFIER_JOB_POLL_TIMEOUT', 120),
+        'upload_max_side': getattr(settings, 'CLASSIFIER_UPLOAD_MAX_SIDE', 1024),
     }
-    return render(request, 'classifier/practice.html', context)
+    with metrics.timer('render'):
+        return render(request, 'classifier/practice.html', context)
 
-def theory(request):
-    """Страница теории машинного обучения - показывает text.html с sidebar навигацией"""
-    from .utils import FIXED_NAVIGATION_STRUCTURE
+def _job_payload(job_id, job):
+    payload = {'job_id': job_id, 'status': job['status']}
+    if job['status'] == jobs.STATUS_DONE:
+        payload['result'] = job['result']
+        payload['result_url'] = reverse('practice') + f'?job={job_id}'
+    elif job['status'] == jobs.STATUS_ERROR:
+        payload['error'] = job['error']
+    return payload
+
+@require_POST
+def job_create(request):
+    """Создает задачу классификации и сразу возвращает ее id"""
+    if 'image' not in request.FILES:
+        return JsonResponse({'error': 'Не передано изображение (поле image)'}, status=400)
+    uploaded_file = request.FILES['image']
+    try:
+        with metrics.timer('normalize'):
+            image_data = normalize_upload(uploaded_file.read())
+    except Exception as e:
+        return JsonResponse({'error': f"Ошибка при обработке изображения: {str(e)}"}, status=400)
+    try:
+        job_id = jobs.submit(image_data, image_url=_save_for_display(uploaded_file, image_data))
+    except jobs.QueueFull:
+        response = JsonResponse({'error': 'Сервер перегружен, повторите попытку позже'}, status=503)
+        response['Retry-After'] = '5'
+        return response
+    return JsonResponse({
+        'job_id': job_id,
+        'status': jobs.STATUS_PENDING,
+        'status_url': reverse('job_status', args=[job_id]),
+        'events_url': reverse('job_events', args=[job_id]),
+    }, status=202)
+
+@require_GET
+def job_status(request, job_id):
+    """Состояние задачи для опроса клиентом"""
+    job = jobs.get(job_id)
+    if job is None:
+        return JsonResponse({'error': 'Задача не найдена'}, status=404)
+    return JsonResponse(_job_payload(job_id, job))
+
+@require_GET
+def job_events(request, job_id):
+    """Состояние задачи потоком Server-Sent Events до ее завершения.
+
+    Держит воркер, пока задача выполняется, поэтому с синхронными воркерами
+    gunicorn страница practice использует опрос job_status.
+    """
+    def stream():
+        deadline = time.monotonic() + getattr(settings, 'CLASSIFIER_JOB_EVENTS_TIMEOUT', 60)
+        last_status = None
+        while time.monotonic() < deadline:
+            job = jobs.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Задача не найдена'})}\n\n"
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"event: status\ndata: {json.dumps(_job_payload(job_id, job))}\n\n"
+            if job['status'] in jobs.FINISHED_STATUSES:
+                return
+            time.sleep(0.2)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+API_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+def _read_archive(archive, max_images, max_image_bytes, max_total_bytes):
+    """Читает изображения из zip-архива; возвращает [(имя, bytes)].
+
+    Ограничения проверяются по размерам из оглавления архива до распаковки:
+    zipfile не распаковывает больше заявленного file_size, поэтому сумма
+    file_size ограничивает и память на весь архив.
+    """
+    with zipfile.ZipFile(archive) as zf:
+        infos = [info for info in zf.infolist()
+                 if not info.is_dir() and info.filename.lower().endswith(API_IMAGE_EXTENSIONS)]
+        if len(infos) > max_images:
+            raise ValueError(f"В запросе больше {max_images} изображений")
+        total_bytes = 0
+        for info in infos:
+            if info.file_size > max_image_bytes:
+                raise ValueError(f"Файл {info.filename} в архиве больше {max_image_bytes} байт")
+            total_bytes += info.file_size
+        if total_bytes > max_total_bytes:
+            raise ValueError(f"Изображения в запросе больше {max_total_bytes} байт")
+        return [(info.filename, zf.read(info)) for info in infos]
+
+@csrf_exempt
+@require_POST
+def api_classify(request):
+    """JSON API: классифицирует несколько изображений за один запрос.
+
+    Изображения передаются в multipart-поле images (можно несколько) и/или
+    zip-архивом в поле archive. Необязательный параметр top_k сокращает
+    all_predictions до k самых вероятных классов, min_confidence (проценты)
+    заменяет неуверенные ответы на класс uncertain.
+    """
+    max_images = getattr(settings, 'CLASSIFIER_API_MAX_IMAGES', 256)
+    max_image_bytes = getattr(settings, 'CLASSIFIER_API_MAX_IMAGE_BYTES', 10 * 1024 * 1024)
+    max_total_bytes = getattr(settings, 'CLASSIFIER_API_MAX_TOTAL_BYTES', 100 * 1024 * 1024)
+    try:
+        top_k = int(request.POST.get('top_k') or request.GET.get('top_k') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'top_k должен быть целым числом'}, status=400)
+    if top_k < 0:
+        return JsonResponse({'error': 'top_k не может быть отрицательным'}, status=400)
+    try:
+        min_confidence = request.POST.get('min_confidence') or request.GET.get('min_confidence')
+        min_confidence = float(min_confidence) if min_confidence else None
+    except ValueError:
+        return JsonResponse({'error': 'min_confidence должен быть числом (проценты)'}, status=400)
     
-    html_file_path = os.path.join(settings.BASE_DIR, 'text.html')
-    content = ""
-    error_message = ""
-    sections_content = {}
+    uploaded_files = request.FILES.getlist('images')
+    if len(uploaded_files) > max_images:
+        return JsonResponse({'error': f"В запросе больше {max_images} изображений"}, status=400)
+    for uploaded_file in uploaded_files:
+        if uploaded_file.size > max_image_bytes:
+            return JsonResponse({'error': f"Файл {uploaded_file.name} больше {max_image_bytes} байт"}, status=400)
+    total_bytes = sum(f.size for f in uploaded_files)
+    if total_bytes > max_total_bytes:
+        return JsonResponse({'error': f"Изображения в запросе больше {max_total_bytes} байт"}, status=400)
+    images = [(f.name, f.read()) for f in uploaded_files]
+    try:
+        for archive in request.FILES.getlist('archive'):
+            archive_images = _read_archive(archive, max_images - len(images), max_image_bytes,
+                                           max_total_bytes - total_bytes)
+            total_bytes += sum(len(data) for _, data in archive_images)
+            images.extend(archive_images)
+    except (zipfile.BadZipFile, ValueError) as e:
+        return JsonResponse({'error': f"Ошибка чтения архива: {str(e)}"}, status=400)
     
-    if os.path.exists(html_file_path):
-        try:
-            # Читаем файл в UTF-8 (text.html использует UTF-8)
-            with open(html_file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Извлекаем содержимое из контейнера (div.container)
-            if content:
-                # Ищем div.container
-                container_match = re.search(r'<div[^>]*class=["\']container["\'][^>]*>(.*?)</div>\s*</body>', content, re.DOTALL | re.IGNORECASE)
-                if container_match:
-                    content = container_match.group(1)
-                    # Удаляем оглавление (toc), так как у нас есть sidebar навигация
-                    content = re.sub(r'<div[^>]*class=["\']toc["\'][^>]*>.*?</div>', '', content, flags=re.DOTALL | re.IGNORECASE)
-                    # Удаляем hr после оглавления
-                    content = re.sub(r'<hr[^>]*>', '', content, flags=re.IGNORECASE)
-                    # Удаляем мета-информацию (название, авторы и т.д.) до первого h1
-                    content = re.sub(r'<p>Название:.*?</p>', '', content, flags=re.DOTALL | re.IGNORECASE)
-                    content = re.sub(r'<p>Электронное учебное пособие.*?</p>', '', content, flags=re.DOTALL | re.IGNORECASE)
-                    content = re.sub(r'<p>Авторы:.*?</p>', '', content, flags=re.DOTALL | re.IGNORECASE)
-                    content = re.sub(r'<p>Учебное заведение:.*?</p>', '', content, flags=re.DOTALL | re.IGNORECASE)
-                    content = re.sub(r'<p>Год:.*?</p>', '', content, flags=re.DOTALL | re.IGNORECASE)
-                else:
-                    # Если не нашли container, извлекаем body
-                    body_match = re.search(r'<body[^>]*>(.*?)</body>', content, re.DOTALL | re.IGNORECASE)
-                    if body_match:
-                        content = body_match.group(1)
-                        # Удаляем оглавление
-                        content = re.sub(r'<div[^>]*class=["\']toc["\'][^>]*>.*?</div>', '', content, flags=re.DOTALL | re.IGNORECASE)
-                        content = re.sub(r'<hr[^>]*>', '', content, flags=re.IGNORECASE)
-                
-                # Разделяем контент по секциям
-                for i, nav_item in enumerate(FIXED_NAVIGATION_STRUCTURE):
-                    section_id = nav_item['id']
-                    # Ищем начало секции по ID
-                    pattern = rf'<h[12][^>]*id=["\']?{re.escape(section_id)}["\'][^>]*>.*?</h[12]>'
-                    match = re.search(pattern, content, re.DOTALL | re.IGNORECASE)
-                    
-                    if match:
-                        start_pos = match.start()
-                        # Ищем конец секции
-                        end_pos = len(content)
-                        
-                        # Ищем следующую секцию того же или более высокого уровня
-                        for j in range(i + 1, len(FIXED_NAVIGATION_STRUCTURE)):
-                            next_item = FIXED_NAVIGATION_STRUCTURE[j]
-                            next_id = next_item['id']
-                            
-                            # Для секций уровня 1 - ищем следующую секцию уровня 1
-                            # Для секций уровня 2 - ищем следующую секцию уровня 2 того же родителя или следующую секцию уровня 1
-                            if nav_item['level'] == 1:
-                                if next_item['level'] == 1:
-                                    next_pattern = rf'<h[12][^>]*id=["\']?{re.escape(next_id)}["\'][^>]*>'
-                                    next_match = re.search(next_pattern, content[start_pos:], re.IGNORECASE)
-                                    if next_match:
-                                        end_pos = start_pos + next_match.start()
-                                        break
-                            else:  # level == 2
-                                # Ищем следующую секцию уровня 2 того же родителя или следующую секцию уровня 1
-                                if (next_item['level'] == 2 and next_item.get('parent') == nav_item.get('parent')) or next_item['level'] == 1:
-                                    next_pattern = rf'<h[12][^>]*id=["\']?{re.escape(next_id)}["\'][^>]*>'
-                                    next_match = re.search(next_pattern, content[start_pos:], re.IGNORECASE)
-                                    if next_match:
-                                        end_pos = start_pos + next_match.start()
-                                        break
-                        
-                        section_content = content[start_pos:end_pos]
-                        sections_content[section_id] = section_content
-        except Exception as e:
-            error_message = f"Ошибка чтения файла: {str(e)}"
-    else:
-        error_message = f"Файл text.html не найден в корне проекта: {settings.BASE_DIR}"
+    if not images:
+        return JsonResponse({'error': 'Не переданы изображения (поля images или archive)'}, status=400)
+    if len(images) > max_images:
+        return JsonResponse({'error': f"В запросе больше {max_images} изображений"}, status=400)
     
-    context = {
-        'html_content': content,
-        'sections_content': sections_content,
-        'error_message': error_message,
-        'navigation': FIXED_NAVIGATION_STRUCTURE,
-    }
-    return render(request, 'classifier/theory.html', context)
+    results = classify_batch([data for _, data in images], top_k=top_k or None, min_confidence=min_confidence)
+    return JsonResponse({
+        'count': len(results),
+        'results': [{'name': name, **result} for (name, _), result in zip(images, results)],
+    })
+
+def theory(request):
+    """Страница теории машинного обучения - навигация и первая секция;
+    остальные секции страница подгружает через theory_section"""
+    return render(request, 'classifier/theory.html', get_theory_page_context())
+
+def _get_theory_or_none():
+    """Содержимое теории или None, если секций в базе нет и text.html отсутствует"""
+    try:
+        return get_theory()
+    except FileNotFoundError:
+        return None
+
+def _theory_fragment(section_id=None):
+    """HTML одной секции или, если section_id не указан, всего текста; None - не найдено"""
+    theory_data = _get_theory_or_none()
+    if theory_data is None:
+        return None
+    if section_id is None:
+        return theory_data['content']
+    return theory_data['sections'].get(section_id)
+
+def _theory_fragment_etag(request, section_id=None):
+    fragment = _theory_fragment(section_id)
+    if fragment is None:
+        return None
+    return hashlib.md5(fragment.encode('utf-8')).hexdigest()
+
+def _theory_last_modified(request, section_id=None):
+    theory_data = _get_theory_or_none()
+    return theory_data.get('updated_at') if theory_data is not None else None
+
+@require_GET
+@condition(etag_func=_theory_fragment_etag, last_modified_func=_theory_last_modified)
+def theory_section(request, section_id=None):
+    """HTML-фрагмент одной секции теории (или всего текста) для подгрузки страницей.
+
+    Ответ кэшируется браузером и nginx и перепроверяется по ETag/Last-Modified.
+    """
+    fragment = _theory_fragment(section_id)
+    if fragment is None:
+        raise Http404("Секция не найдена")
+    response = HttpResponse(fragment, content_type='text/html; charset=utf-8')
+    patch_cache_control(response, public=True,
+                        max_age=getattr(settings, 'CLASSIFIER_THEORY_FRAGMENT_MAX_AGE', 300))
+    return response
+
+@require_GET
+def theory_search(request):
+    """Полнотекстовый поиск по секциям теории: ?q=<запрос>&limit=<число результатов>"""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        return JsonResponse({'error': 'limit должен быть целым числом'}, status=400)
+    try:
+        results = search_sections(query, limit) if query else []
+    except FileNotFoundError:
+        results = []
+    return JsonResponse({'query': query, 'results': results})
@@ -158,6 +158,13 @@ ALLOWED_HOSTS=wasteclfmodel.kz,www.wasteclfmodel.kz,localhost,127.0.0.1
 # DB_PASSWORD=your_password_here
 # DB_HOST=localhost
 # DB_PORT=5432
+
+# Сервер модели (одна копия модели на все воркеры gunicorn)
+# Раскомментируйте и перезапустите сервисы: systemctl restart wasteclfmodel-inference wasteclfmodel
+# CLASSIFIER_MODEL_SERVER_SOCKET=/run/wasteclfmodel-model.sock
+
+# Прогрев модели при старте воркеров (готовность: /ready/)
+# CLASSIFIER_WARMUP=True
 EOF
     chmod 600 $ENV_FILE
     chown $APP_USER:$APP_USER $ENV_FILE
@@ -231,6 +238,9 @@ sudo -u $APP_USER bash -c "cd $PROJECT_DIR && source venv/bin/activate && python
 log_info "Сбор статических файлов..."
 sudo -u $APP_USER bash -c "cd $PROJECT_DIR && source venv/bin/activate && python manage.py collectstatic --noinput"
 
+log_info "Статическая сборка страницы теории..."
+sudo -u $APP_USER bash -c "cd $PROJECT_DIR && source venv/bin/activate && python manage.py build_theory_static"
+
 # Создаем директории для media и staticfiles если их нет
 mkdir -p $PROJECT_DIR/media
 mkdir -p $PROJECT_DIR/staticfiles
@@ -249,7 +259,9 @@ chown $APP_USER:$APP_USER /run
 cat > /etc/systemd/system/wasteclfmodel.service << EOF
 [Unit]
 Description=wasteclfmodel gunicorn daemon
-After=network.target
+# Порядок запуска относительно сервера модели; сама зависимость (Wants=)
+# добавляется ниже, только если сервер модели включен в .env
+After=network.target wasteclfmodel-inference.service
 
 [Service]
 User=$APP_USER
@@ -267,13 +279,49 @@ ExecStart=$PROJECT_DIR/venv/bin/gunicorn \\
 WantedBy=multi-user.target
 EOF
 
+# Сервер модели: один процесс держит модель, воркеры gunicorn обращаются к нему
+# через Unix-сокет (включается переменной CLASSIFIER_MODEL_SERVER_SOCKET в .env)
+MODEL_SOCKET="/run/wasteclfmodel-model.sock"
+cat > /etc/systemd/system/wasteclfmodel-inference.service << EOF
+[Unit]
+Description=wasteclfmodel model server
+After=network.target
+Before=wasteclfmodel.service
+
+[Service]
+User=$APP_USER
+Group=$APP_USER
+WorkingDirectory=$PROJECT_DIR
+Environment="PATH=$PROJECT_DIR/venv/bin"
+EnvironmentFile=$ENV_FILE
+ExecStart=$PROJECT_DIR/venv/bin/python manage.py run_model_server --socket $MODEL_SOCKET
+Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 # ============================================
 # 12. Настройка Nginx
 # ============================================
 log_info "Настройка Nginx..."
 DOMAIN="wasteclfmodel.kz"
 
+mkdir -p /var/cache/nginx/wasteclfmodel
+THEORY_BUILD="$PROJECT_DIR/theory_build"
+
+# brotli_static доступен только с модулем ngx_brotli
+apt-get install -y libnginx-mod-http-brotli-static || log_warn "Модуль brotli для Nginx не установлен, используется только gzip"
+if ls /etc/nginx/modules-enabled/ 2>/dev/null | grep -q brotli; then
+    BROTLI_STATIC="brotli_static on;"
+else
+    BROTLI_STATIC=""
+fi
+
 cat > /etc/nginx/sites-available/wasteclfmodel << EOF
+# Кэш фрагментов теории (ответы Django с Cache-Control: public и ETag)
+proxy_cache_path /var/cache/nginx/wasteclfmodel levels=1:2 keys_zone=wasteclf_theory:10m max_size=50m inactive=60m;
+
 server {
     listen 80;
     server_name $DOMAIN www.$DOMAIN;
@@ -288,6 +336,56 @@ server {
         alias $PROJECT_DIR/media/;
     }
 
+    # Теория: готовая статическая сборка (manage.py build_theory_static) со
+    # сжатыми вариантами, а если ее нет - Django
+    location = /theory/ {
+        root $THEORY_BUILD;
+        default_type "text/html; charset=utf-8";
+        gzip_static on;
+        $BROTLI_STATIC
+        try_files /index.html @django;
+    }
+
+    location = /theory/full/ {
+        root $THEORY_BUILD;
+        default_type "text/html; charset=utf-8";
+        gzip_static on;
+        $BROTLI_STATIC
+        add_header Cache-Control "public, max-age=300";
+        try_files /full.html @theory_fragments;
+    }
+
+    location ~ ^/theory/sections/(?<theory_section>[^/]+)/\$ {
+        root $THEORY_BUILD;
+        default_type "text/html; charset=utf-8";
+        gzip_static on;
+        $BROTLI_STATIC
+        add_header Cache-Control "public, max-age=300";
+        try_files /sections/\$theory_section.html @theory_fragments;
+    }
+
+    location @theory_fragments {
+        include proxy_params;
+        proxy_pass http://unix:$GUNICORN_SOCKET;
+        proxy_cache wasteclf_theory;
+        proxy_cache_revalidate on;
+        proxy_cache_use_stale updating;
+        add_header X-Cache-Status \$upstream_cache_status;
+    }
+
+    # Метрики Prometheus - только для локального сборщика
+    location = /metrics {
+        allow 127.0.0.1;
+        deny all;
+        include proxy_params;
+        proxy_pass http://unix:$GUNICORN_SOCKET;
+    }
+
+    location @django {
+        include proxy_params;
+        proxy_pass http://unix:$GUNICORN_SOCKET;
+    }
+
     location / {
         include proxy_params;
         proxy_pass http://unix:$GUNICORN_SOCKET;
@@ -311,9 +409,27 @@ nginx -t
 # ============================================
 log_info "Запуск сервисов..."
 
+# Gunicorn зависит от сервера модели, только если он включен в .env
+DROPIN_DIR="/etc/systemd/system/wasteclfmodel.service.d"
+if grep -q "^CLASSIFIER_MODEL_SERVER_SOCKET=" $ENV_FILE; then
+    mkdir -p $DROPIN_DIR
+    cat > $DROPIN_DIR/inference.conf << EOF
+[Unit]
+Wants=wasteclfmodel-inference.service
+EOF
+else
+    rm -f $DROPIN_DIR/inference.conf
+fi
+
 # Перезагружаем systemd
 systemctl daemon-reload
 
+# Запускаем сервер модели, если он включен в .env
+if grep -q "^CLASSIFIER_MODEL_SERVER_SOCKET=" $ENV_FILE; then
+    systemctl enable wasteclfmodel-inference
+    systemctl restart wasteclfmodel-inference
+fi
+
 # Запускаем Gunicorn
 systemctl enable wasteclfmodel
 systemctl restart wasteclfmodel
@@ -2,319 +2,487 @@
 # -*- coding: utf-8 -*-
 """
 Улучшенная конвертация текста в HTML с якорями и ссылками
+
+Конвертер - потоковый конвейер генераторов: строки читаются из файла по одной
+(read_lines), за один проход размечаются (classify_lines), группируются по
+секциям (iter_sections) и рендерятся в HTML, который сразу пишется в файл.
+В инкрементальном режиме (--incremental) HTML секций кэшируется по хэшу их
+содержимого, и заново рендерятся только изменившиеся секции.
+
+Использование: python txt_to_html_v2.py [text_extracted.txt] [text.html] [--incremental]
 """
 
-import re
+import argparse
+import hashlib
 import html
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+SLUG_INVALID_RE = re.compile(r'[^\w\s-]')
+SLUG_SEPARATOR_RE = re.compile(r'[-\s]+')
+
+# Заголовок уровня 1: начинается с цифры и точки
+H1_NUMBER_RE = re.compile(r'^\d+\.\s+')
+NUMBERED_LINE_RE = re.compile(r'^\d+\.')
+# Специальные заголовки
+H1_TITLES = frozenset(['Введение', 'Актуальность', 'Список литературы'])
+# Строки с этих слов заголовками уровня 2 не считаются
+H2_EXCLUDED_PREFIXES = ('В ', 'На ', 'Для ', 'Пример', 'Цель', 'Отличие', 'Применение', 'Основная')
+
+EXAMPLE_PREFIXES = ('Пример:', 'Примечание:')
+CODE_START_PREFIXES = ('import ', 'from ', '# ')
+CODE_MARKERS = ('pd.', 'sklearn', 'plt.', 'clf.', 'data[')
+CODE_CONTINUATION_PREFIXES = ('import ', 'from ', '# ', '    ', '\t', 'print(', 'plt.', 'clf.', 'data[', 'X_', 'y_')
+CODE_NEXT_MARKERS = ('import', 'from', '=')
+LIST_PREFIXES = ('*', 'o', '•')
+LIST_MARKER_CHARS = '*o•- '
+
+HEADER_KINDS = ('h1', 'h2')
+
 
 def create_slug(text):
     """Создает URL-friendly идентификатор из текста"""
-    slug = re.sub(r'[^\w\s-]', '', text.lower())
-    slug = re.sub(r'[-\s]+', '-', slug)
+    slug = SLUG_INVALID_RE.sub('', text.lower())
+    slug = SLUG_SEPARATOR_RE.sub('-', slug)
     return slug.strip('-')
 
+
 def is_header(line, prev_line, next_line):
     """Определяет, является ли строка заголовком"""
     line = line.strip()
     
-    # Заголовок уровня 1: начинается с цифры и точки
-    if re.match(r'^\d+\.\s+', line):
-        return 'h1'
-    
-    # Специальные заголовки
-    if line in ['Введение', 'Актуальность', 'Список литературы']:
+    if H1_NUMBER_RE.match(line) or line in H1_TITLES:
         return 'h1'
     
     # Заголовок уровня 2: короткая строка, начинается с заглавной, 
     # предыдущая строка пустая или заканчивается точкой/двоеточием,
-    # следующая строка начинается с маленькой буквы или тире
-    if (len(line) < 80 and 
-        line[0].isupper() and 
-        not line.endswith('.') and
-        not line.endswith(',') and
-        not ':' in line and
-        not line.startswith('В ') and
-        not line.startswith('На ') and
-        not line.startswith('Для ') and
-        not line.startswith('Пример') and
-        not line.startswith('Цель') and
-        not line.startswith('Отличие') and
-        not line.startswith('Применение') and
-        not line.startswith('Основная') and
-        prev_line and (not prev_line.strip() or prev_line.strip().endswith('.') or prev_line.strip().endswith(':') or re.match(r'^\d+\.', prev_line.strip())) and
-        next_line and (next_line.strip()[0].islower() if next_line.strip() else True or next_line.strip().startswith('—') or next_line.strip().startswith('Пример'))):
-        return 'h2'
+    # следующая строка пустая или начинается с маленькой буквы
+    if (len(line) < 80 and
+            line[0].isupper() and
+            not line.endswith(('.', ',')) and
+            ':' not in line and
+            not line.startswith(H2_EXCLUDED_PREFIXES) and
+            prev_line and next_line):
+        prev_stripped = prev_line.strip()
+        next_stripped = next_line.strip()
+        if ((not prev_stripped or prev_stripped.endswith(('.', ':')) or NUMBERED_LINE_RE.match(prev_stripped)) and
+                (not next_stripped or next_stripped[0].islower())):
+            return 'h2'
     
     return None
 
-def parse_text_to_html(text_content):
-    """Парсит текст и создает HTML с якорями"""
-    lines = text_content.split('\n')
-    html_parts = []
-    toc = []
-    in_list = False
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        prev_line = lines[i-1] if i > 0 else ''
-        next_line = lines[i+1] if i < len(lines) - 1 else ''
+
+def is_code_start(line):
+    return line.startswith(CODE_START_PREFIXES) or ('=' in line and any(marker in line for marker in CODE_MARKERS))
+
+
+def is_code_continuation(line):
+    return not line or line.startswith(CODE_CONTINUATION_PREFIXES) or '=' in line
+
+
+def is_list_item(line):
+    return line.startswith(LIST_PREFIXES) or (line.startswith('-') and not line.startswith('--'))
+
+
+def read_lines(path):
+    """Читает файл построчно (строки без перевода строки, как text.split('\\n'))"""
+    with open(path, 'r', encoding='utf-8') as f:
+        line = ''
+        for line in f:
+            yield line[:-1] if line.endswith('\n') else line
+        if not line or line.endswith('\n'):
+            yield ''
+
+
+class LineCursor:
+    """Текущая строка потока вместе с предыдущей и следующей"""
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self.prev = ''
+        self.current = next(self._lines, None)
+        self.next = next(self._lines, None)
+
+    def advance(self):
+        self.prev = self.current
+        self.current = self.next
+        self.next = next(self._lines, None)
+
+
+def classify_lines(lines):
+    """Размечает строки за один проход: выдает (тип, текст), где тип -
+    h1, h2, empty, example, code, item или text"""
+    cursor = LineCursor(lines)
+    while cursor.current is not None:
+        line = cursor.current.strip()
         
         if not line:
-            if in_list:
-                html_parts.append('</ul>')
-                in_list = False
-            html_parts.append('<p></p>')
-            i += 1
+            yield 'empty', ''
+            cursor.advance()
             continue
         
-        # Проверяем, является ли строка заголовком
-        header_type = is_header(line, prev_line, next_line)
+        header_type = is_header(line, cursor.prev, cursor.next or '')
         
         if header_type == 'h1':
-            if in_list:
-                html_parts.append('</ul>')
-                in_list = False
-            section_text = re.sub(r'^\d+\.\s+', '', line)
-            section_id = create_slug(section_text)
-            toc.append(('h1', section_text, section_id))
-            html_parts.append(f'<h1 id="{section_id}">{html.escape(section_text)}</h1>')
+            yield 'h1', H1_NUMBER_RE.sub('', line)
         
         elif header_type == 'h2':
-            if in_list:
-                html_parts.append('</ul>')
-                in_list = False
-            section_id = create_slug(line)
-            toc.append(('h2', line, section_id))
-            html_parts.append(f'<h2 id="{section_id}">{html.escape(line)}</h2>')
+            yield 'h2', line
         
         # Строки, начинающиеся с "Пример:" или "Примечание:"
-        elif line.startswith('Пример:') or line.startswith('Примечание:'):
-            if in_list:
-                html_parts.append('</ul>')
-                in_list = False
-            html_parts.append(f'<p class="example"><strong>{html.escape(line)}</strong></p>')
+        elif line.startswith(EXAMPLE_PREFIXES):
+            yield 'example', line
         
-        # Строки с кодом Python
-        elif (line.startswith('import ') or 
-              line.startswith('from ') or 
-              line.startswith('# ') or 
-              ('=' in line and ('pd.' in line or 'sklearn' in line or 'plt.' in line or 'clf.' in line or 'data[' in line))):
-            if in_list:
-                html_parts.append('</ul>')
-                in_list = False
-            # Начинаем блок кода
+        # Строки с кодом Python: блок продолжается, пока строки похожи на код
+        elif is_code_start(line):
             code_lines = [line]
-            i += 1
-            while i < len(lines):
-                next_line = lines[i].strip()
-                if (next_line.startswith('import ') or 
-                    next_line.startswith('from ') or 
-                    next_line.startswith('# ') or
-                    next_line.startswith('    ') or
-                    next_line.startswith('\t') or
-                    '=' in next_line or
-                    next_line.startswith('print(') or
-                    next_line.startswith('plt.') or
-                    next_line.startswith('clf.') or
-                    next_line.startswith('data[') or
-                    next_line.startswith('X_') or
-                    next_line.startswith('y_') or
-                    next_line == ''):
-                    if next_line:
-                        code_lines.append(next_line)
-                    elif i + 1 < len(lines) and lines[i+1].strip() and ('import' in lines[i+1] or 'from' in lines[i+1] or '=' in lines[i+1]):
-                        code_lines.append('')
-                    else:
-                        break
+            cursor.advance()
+            while cursor.current is not None:
+                code_line = cursor.current.strip()
+                if not is_code_continuation(code_line):
+                    break
+                if code_line:
+                    code_lines.append(code_line)
+                elif (cursor.next is not None and cursor.next.strip() and
+                        any(marker in cursor.next for marker in CODE_NEXT_MARKERS)):
+                    code_lines.append('')
                 else:
                     break
-                i += 1
-            code_block = '\n'.join(code_lines)
-            html_parts.append(f'<pre><code class="language-python">{html.escape(code_block)}</code></pre>')
+                cursor.advance()
+            yield 'code', '\n'.join(code_lines)
             continue
         
         # Списки
-        elif (line.startswith('*') or 
-              line.startswith('o') or 
-              line.startswith('•') or
-              (line.startswith('-') and not line.startswith('--'))):
-            if not in_list:
-                html_parts.append('<ul>')
-                in_list = True
-            clean_line = line.lstrip("*o•- ")
-            html_parts.append(f'<li>{html.escape(clean_line)}</li>')
+        elif is_list_item(line):
+            yield 'item', line.lstrip(LIST_MARKER_CHARS)
         
         # Обычный текст
         else:
-            if in_list:
-                html_parts.append('</ul>')
-                in_list = False
-            html_parts.append(f'<p>{html.escape(line)}</p>')
+            yield 'text', line
         
-        i += 1
-    
+        cursor.advance()
+
+
+def iter_sections(tokens):
+    """Группирует размеченные строки по секциям: каждая начинается с заголовка
+    (кроме, возможно, первой - текста до первого заголовка)"""
+    section = []
+    for token in tokens:
+        if token[0] in HEADER_KINDS and section:
+            yield section
+            section = []
+        section.append(token)
+    if section:
+        yield section
+
+
+def section_toc(section):
+    """Записи оглавления секции: [(уровень, текст, якорь)]"""
+    kind, text = section[0]
+    if kind in HEADER_KINDS:
+        return [(kind, text, create_slug(text))]
+    return []
+
+
+def section_hash(section):
+    return hashlib.md5(json.dumps(section, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def render_section(section):
+    """Рендерит секцию в HTML; список, открытый в секции, закрывается в ней же"""
+    in_list = False
+    for kind, text in section:
+        if kind == 'item':
+            if not in_list:
+                yield '<ul>'
+                in_list = True
+            yield f'<li>{html.escape(text)}</li>'
+            continue
+        if in_list:
+            yield '</ul>'
+            in_list = False
+        if kind == 'empty':
+            yield '<p></p>'
+        elif kind in HEADER_KINDS:
+            yield f'<{kind} id="{create_slug(text)}">{html.escape(text)}</{kind}>'
+        elif kind == 'example':
+            yield f'<p class="example"><strong>{html.escape(text)}</strong></p>'
+        elif kind == 'code':
+            yield f'<pre><code class="language-python">{html.escape(text)}</code></pre>'
+        else:
+            yield f'<p>{html.escape(text)}</p>'
     if in_list:
-        html_parts.append('</ul>')
-    
+        yield '</ul>'
+
+
+def parse_text_to_html(text_content):
+    """Парсит текст и создает HTML с якорями"""
+    html_parts = []
+    toc = []
+    for section in iter_sections(classify_lines(text_content.split('\n'))):
+        toc.extend(section_toc(section))
+        html_parts.extend(render_section(section))
     return html_parts, toc
 
-def create_html_document(text_content, output_file='text.html'):
-    """Создает полный HTML документ"""
-    html_parts, toc = parse_text_to_html(text_content)
-    
-    # Создаем оглавление
-    toc_html = '<div class="toc"><h2>Содержание</h2><ul>'
+
+def render_toc(toc):
+    parts = ['<div class="toc"><h2>Содержание</h2><ul>']
     for level, text, anchor in toc:
-        toc_html += f'<li class="toc-{level}"><a href="#{anchor}">{html.escape(text)}</a></li>'
-    toc_html += '</ul></div>'
+        parts.append(f'<li class="toc-{level}"><a href="#{anchor}">{html.escape(text)}</a></li>')
+    parts.append('</ul></div>')
+    return ''.join(parts)
+
+
+def load_cache(cache_file):
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'sections': [], 'parts': {}}
+
+
+def save_cache(cache_file, cache):
+    tmp_file = f'{cache_file}.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_file, cache_file)
+
+
+def write_html_document(lines, output_file='text.html', cache_file=None):
+    """Потоково пишет HTML документ из строк текста.
+
+    Тело документа пишется во временный файл по мере рендеринга, оглавление
+    собирается попутно и ставится в начало при сборке итогового файла.
+    Если задан cache_file, HTML неизменившихся секций берется из кэша, а при
+    полностью совпадающем наборе секций файл не перезаписывается.
+    Возвращает (оглавление, число отрендеренных секций, файл перезаписан).
+    """
+    cache = load_cache(cache_file) if cache_file else {'sections': [], 'parts': {}}
+    cached_parts = cache['parts']
+    new_parts = {}
+    section_hashes = []
+    toc = []
+    rendered = 0
     
-    # Объединяем все части
-    body_content = '\n'.join(html_parts)
+    with tempfile.TemporaryFile('w+', encoding='utf-8') as body:
+        separator = ''
+        for section in iter_sections(classify_lines(lines)):
+            key = section_hash(section)
+            parts = cached_parts.get(key)
+            if parts is None:
+                parts = list(render_section(section))
+                rendered += 1
+            new_parts[key] = parts
+            section_hashes.append(key)
+            toc.extend(section_toc(section))
+            for part in parts:
+                body.write(separator)
+                body.write(part)
+                separator = '\n'
+        
+        if cache_file and section_hashes == cache['sections'] and os.path.exists(output_file):
+            return toc, rendered, False
+        
+        body.seek(0)
+        tmp_file = f'{output_file}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(DOCUMENT_HEAD)
+            f.write(render_toc(toc))
+            f.write(DOCUMENT_MIDDLE)
+            shutil.copyfileobj(body, f)
+            f.write(DOCUMENT_TAIL)
+        os.replace(tmp_file, output_file)
     
-    # Создаем полный HTML
-    html_doc = f'''<!DOCTYPE html>
+    if cache_file:
+        save_cache(cache_file, {'sections': section_hashes, 'parts': new_parts})
+    return toc, rendered, True
+
+
+def report(output_file, toc, rendered, written):
+    if written:
+        print(f"HTML файл создан: {output_file}")
+    else:
+        print(f"HTML файл не изменился: {output_file}")
+    print(f"Найдено разделов в оглавлении: {len(toc)}")
+    print(f"Отрендерено секций: {rendered}")
+    for level, text, anchor in toc[:10]:
+        print(f"  {level}: {text[:50]}")
+
+
+def create_html_document(text_content, output_file='text.html', cache_file=None):
+    """Создает полный HTML документ"""
+    toc, rendered, written = write_html_document(text_content.split('\n'), output_file, cache_file)
+    report(output_file, toc, rendered, written)
+    return output_file
+
+
+def convert_file(input_file='text_extracted.txt', output_file='text.html', incremental=False):
+    """Конвертирует текстовый файл в HTML, читая его построчно"""
+    cache_file = f'{output_file}.cache.json' if incremental else None
+    toc, rendered, written = write_html_document(read_lines(input_file), output_file, cache_file)
+    report(output_file, toc, rendered, written)
+    if written:
+        sync_theory_static(output_file)
+    return output_file
+
+
+def sync_theory_static(output_file):
+    """Если перезаписан text.html проекта, обновляет статическую сборку теории
+    (classifier/theory_static.py), иначе nginx продолжит отдавать старую"""
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    if os.path.abspath(output_file) != os.path.join(project_dir, 'text.html'):
+        return
+    sys.path.insert(0, project_dir)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'waste_classification.settings')
+    try:
+        import django
+        django.setup()
+        from classifier import theory_static
+    except ImportError:
+        # Без Django сборку обновит первый процесс сайта, прочитавший новый text.html
+        print("Django не найден: статическая сборка теории не проверена")
+        return
+    theory_static.sync_theory_static()
+    if theory_static.get_build_version() is None:
+        print("Статическая сборка теории отсутствует или удалена")
+    else:
+        print("Статическая сборка теории актуальна")
+
+
+# Шаблон документа: до оглавления, между оглавлением и телом, после тела
+DOCUMENT_HEAD = '''<!DOCTYPE html>
 <html lang="ru">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Классификация отходов с использованием методов интеллектуального анализа данных</title>
     <style>
-        body {{
+        body {
             font-family: 'Times New Roman', serif;
             line-height: 1.6;
             max-width: 900px;
             margin: 0 auto;
             padding: 20px;
             background-color: #f5f5f5;
-        }}
-        .container {{
+        }
+        .container {
             background-color: white;
             padding: 40px;
             box-shadow: 0 0 10px rgba(0,0,0,0.1);
-        }}
-        h1 {{
+        }
+        h1 {
             color: #0F4761;
             border-bottom: 3px solid #0F4761;
             padding-bottom: 10px;
             margin-top: 30px;
             margin-bottom: 20px;
             scroll-margin-top: 20px;
-        }}
-        h2 {{
+        }
+        h2 {
             color: #467886;
             margin-top: 25px;
             margin-bottom: 15px;
             padding-left: 10px;
             border-left: 4px solid #467886;
             scroll-margin-top: 20px;
-        }}
-        p {{
+        }
+        p {
             margin: 10px 0;
             text-align: justify;
-        }}
-        .toc {{
+        }
+        .toc {
             background-color: #f9f9f9;
             padding: 20px;
             margin: 20px 0;
             border: 1px solid #ddd;
             border-radius: 5px;
-        }}
-        .toc h2 {{
+        }
+        .toc h2 {
             margin-top: 0;
             color: #0F4761;
             border: none;
             padding: 0;
-        }}
-        .toc ul {{
+        }
+        .toc ul {
             list-style-type: none;
             padding-left: 0;
-        }}
-        .toc li {{
+        }
+        .toc li {
             margin: 8px 0;
             padding-left: 20px;
-        }}
-        .toc-h1 {{
+        }
+        .toc-h1 {
             font-weight: bold;
             font-size: 1.1em;
-        }}
-        .toc-h2 {{
+        }
+        .toc-h2 {
             font-weight: normal;
             font-size: 0.95em;
             padding-left: 30px;
-        }}
-        .toc a {{
+        }
+        .toc a {
             color: #467886;
             text-decoration: none;
-        }}
-        .toc a:hover {{
+        }
+        .toc a:hover {
             text-decoration: underline;
             color: #0F4761;
-        }}
-        ul {{
+        }
+        ul {
             margin: 10px 0;
             padding-left: 30px;
-        }}
-        li {{
+        }
+        li {
             margin: 5px 0;
-        }}
-        pre {{
+        }
+        pre {
             background-color: #f4f4f4;
             border: 1px solid #ddd;
             border-radius: 4px;
             padding: 15px;
             overflow-x: auto;
             margin: 15px 0;
-        }}
-        code {{
+        }
+        code {
             font-family: 'Courier New', monospace;
             font-size: 0.9em;
-        }}
-        .example {{
+        }
+        .example {
             background-color: #fff3cd;
             padding: 10px;
             border-left: 4px solid #ffc107;
             margin: 15px 0;
-        }}
-        a {{
+        }
+        a {
             color: #467886;
-        }}
-        a:hover {{
+        }
+        a:hover {
             color: #0F4761;
-        }}
-        hr {{
+        }
+        hr {
             border: none;
             border-top: 2px solid #ddd;
             margin: 30px 0;
-        }}
+        }
     </style>
 </head>
 <body>
     <div class="container">
-        {toc_html}
-        <hr>
-        {body_content}
-    </div>
-</body>
-</html>'''
-    
-    # Сохраняем файл
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html_doc)
-    
-    print(f"HTML файл создан: {output_file}")
-    print(f"Найдено разделов в оглавлении: {len(toc)}")
-    for level, text, anchor in toc[:10]:
-        print(f"  {level}: {text[:50]}")
-    
-    return output_file
+        '''
+DOCUMENT_MIDDLE = '\n        <hr>\n        '
+DOCUMENT_TAIL = '\n    </div>\n</body>\n</html>'
+
 
 if __name__ == '__main__':
-    # Читаем текст
-    with open('text_extracted.txt', 'r', encoding='utf-8') as f:
-        text_content = f.read()
+    parser = argparse.ArgumentParser(description='Конвертация текста учебника в HTML с якорями и оглавлением')
+    parser.add_argument('input', nargs='?', default='text_extracted.txt', help='Исходный текстовый файл')
+    parser.add_argument('output', nargs='?', default='text.html', help='Итоговый HTML файл')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Рендерить заново только изменившиеся секции (кэш в <output>.cache.json)')
+    args = parser.parse_args()
     
-    # Создаем HTML
-    create_html_document(text_content, 'text.html')
-
-
+    convert_file(args.input, args.output, incremental=args.incremental)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'classifier.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +84,45 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Кэш 'predictions' - результаты классификации по хэшу изображения.
+# LocMem живет внутри одного воркера; чтобы кэш был общим для всех воркеров
+# gunicorn, замените его на FileBasedCache или локальный Redis.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'predictions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'predictions',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    # Поколение страницы теории: при изменении секций в любом процессе (админка,
+    # manage.py import_theory) все воркеры пересобирают теорию из базы
+    'theory': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'theory',
+        'TIMEOUT': None,
+    },
+    # Состояние асинхронных задач классификации: файловый кэш общий для всех воркеров
+    'jobs': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'jobs',
+        'TIMEOUT': 60 * 10,
+        # При переполнении кэш удаляет треть записей, в том числе незавершенные
+        # задачи: запас должен покрывать все задачи за TIMEOUT
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -130,3 +171,113 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Classifier
+# Бэкенд модели: 'keras' - исходная .h5 через tensorflow + tf_keras,
+# 'tflite' - артефакт из manage.py export_model на легком рантайме
+CLASSIFIER_BACKEND = os.environ.get('CLASSIFIER_BACKEND', 'keras')
+CLASSIFIER_MODEL_PATH = BASE_DIR / 'ob_model' / 'waste_classifier_efficientnet.h5'
+CLASSIFIER_TFLITE_MODEL_PATH = BASE_DIR / 'ob_model' / 'waste_classifier_efficientnet.tflite'
+# Количество потоков TFLite Interpreter (None - по умолчанию рантайма)
+CLASSIFIER_TFLITE_THREADS = None
+
+# Загружать и прогревать модель при старте процесса, а не на первом запросе.
+# Готовность после прогрева отдает /ready/ (503, пока прогрев не завершен).
+CLASSIFIER_WARMUP_ON_STARTUP = os.environ.get('CLASSIFIER_WARMUP', 'False') == 'True'
+
+# Динамическая пакетная обработка запросов к модели (classifier/batching.py).
+# Имеет смысл, когда в одном процессе одновременно обрабатывается несколько
+# запросов (gunicorn --threads, асинхронные задачи, сервер модели).
+CLASSIFIER_BATCHING_ENABLED = False
+CLASSIFIER_BATCH_MAX_SIZE = 16
+CLASSIFIER_BATCH_MAX_WAIT_MS = 10
+
+# Режим сервера модели (python manage.py run_model_server): один процесс держит
+# модель, воркеры gunicorn отправляют ему тензоры через Unix-сокет.
+# Пустая строка - модель загружается в каждом воркере, как раньше.
+CLASSIFIER_MODEL_SERVER_SOCKET = os.environ.get('CLASSIFIER_MODEL_SERVER_SOCKET', '')
+CLASSIFIER_MODEL_SERVER_TIMEOUT = 30
+# При недоступности сервера модели загрузить модель в текущем процессе.
+# По умолчанию выключено: иначе каждый воркер gunicorn при перезапуске сервера
+# модели загрузит свою копию и будет держать ее до конца работы.
+# На тайм-аут (сервер занят или еще прогревается) не срабатывает.
+CLASSIFIER_MODEL_SERVER_FALLBACK = False
+
+# Сохранять загруженные изображения в MEDIA_ROOT для показа на странице результата.
+# Оригинал записывается в фоне, миниатюра - до ответа; False - не сохранять вовсе.
+CLASSIFIER_SAVE_UPLOADS = True
+# Загрузки хранятся в MEDIA_ROOT/<DIR> под именем по SHA-256 содержимого, на
+# странице результата показывается миниатюра (WebP) с длинной стороной THUMBNAIL_SIZE
+CLASSIFIER_UPLOAD_DIR = 'uploads'
+CLASSIFIER_UPLOAD_THUMBNAIL_SIZE = 320
+# Бюджет каталога загрузок: самые старые загрузки сверх MAX_BYTES и старше
+# MAX_AGE_DAYS удаляются (0 - без ограничения). Очистка выполняется в фоне не
+# чаще раза в EVICT_INTERVAL секунд (0 - только командой evict_uploads)
+CLASSIFIER_UPLOAD_MAX_BYTES = 500 * 1024 * 1024
+CLASSIFIER_UPLOAD_MAX_AGE_DAYS = 30
+CLASSIFIER_UPLOAD_EVICT_INTERVAL = 3600
+
+# Кэш предсказаний по SHA-256 изображения и версии модели (см. CACHES['predictions']).
+# Версия модели по умолчанию вычисляется из размера и даты файла модели.
+CLASSIFIER_CACHE_ENABLED = True
+CLASSIFIER_CACHE_ALIAS = 'predictions'
+CLASSIFIER_MODEL_VERSION = ''
+
+# Асинхронные задачи классификации: /practice/ отправляет изображение в
+# /practice/jobs/ и опрашивает результат, инференс идет в фоновом пуле потоков.
+# Пул свой у каждого воркера gunicorn: одновременно выполняется до
+# workers * JOB_WORKERS задач. Чтобы ограничить инференс одной копией модели
+# на все воркеры, включите сервер модели (CLASSIFIER_MODEL_SERVER_SOCKET).
+CLASSIFIER_ASYNC_JOBS_ENABLED = True
+CLASSIFIER_JOB_WORKERS = 2
+# Сколько незавершенных задач (в очереди и выполняемых) принимает один воркер;
+# сверх этого /practice/jobs/ отвечает 503, а не копит очередь в памяти
+CLASSIFIER_JOB_QUEUE_SIZE = 100
+CLASSIFIER_JOBS_CACHE_ALIAS = 'jobs'
+# Сколько секунд страница опрашивает задачу, прежде чем показать ошибку
+# (задача могла потеряться при перезапуске воркера)
+CLASSIFIER_JOB_POLL_TIMEOUT = 120
+# Максимальная длительность потока Server-Sent Events, секунд
+CLASSIFIER_JOB_EVENTS_TIMEOUT = 60
+
+# Минимальная уверенность модели, процентов: ниже нее вместо класса
+# возвращается uncertain ("Не удалось определить"); 0 - порог выключен
+CLASSIFIER_MIN_CONFIDENCE = 0
+
+# JSON API пакетной классификации (/api/classify/)
+CLASSIFIER_API_MAX_IMAGES = 256
+CLASSIFIER_API_MAX_IMAGE_BYTES = 10 * 1024 * 1024
+# Суммарный размер изображений одного запроса, включая распакованные из zip
+CLASSIFIER_API_MAX_TOTAL_BYTES = 100 * 1024 * 1024
+# Размер пакета одного вызова predict в API и пакетной разметке
+CLASSIFIER_API_BATCH_SIZE = 32
+
+# Кэш поколения теории (см. CACHES['theory']); должен быть общим для всех процессов
+CLASSIFIER_THEORY_CACHE_ALIAS = 'theory'
+
+# Время кэширования фрагментов секций теории браузером и nginx, секунд
+# (после истечения фрагмент перепроверяется по ETag/Last-Modified)
+CLASSIFIER_THEORY_FRAGMENT_MAX_AGE = 300
+
+# Статическая сборка теории (python manage.py build_theory_static): nginx отдает
+# готовые HTML и .gz/.br файлы, Django - только если сборки нет.
+# При изменении секций в базе или text.html (проверяется по версии источника в
+# сборке) она удаляется или, с AUTOBUILD, пересобирается.
+CLASSIFIER_THEORY_STATIC_ROOT = BASE_DIR / 'theory_build'
+CLASSIFIER_THEORY_STATIC_AUTOBUILD = False
+
+# Нормализация загрузок /practice/: фото с длинной стороной больше MAX_SIDE
+# уменьшаются (браузером до отправки и сервером до классификации) и
+# перекодируются в JPEG; изображения больше MAX_PIXELS отклоняются по заголовку
+CLASSIFIER_UPLOAD_MAX_SIDE = 1024
+CLASSIFIER_UPLOAD_MAX_PIXELS = 40_000_000
+CLASSIFIER_UPLOAD_JPEG_QUALITY = 90
+
+# Метрики производительности (/metrics в формате Prometheus и заголовок Server-Timing).
+# Каждый процесс сбрасывает свои метрики в METRICS_DIR не чаще раза в FLUSH_INTERVAL
+# секунд, /metrics суммирует файлы всех воркеров
+CLASSIFIER_METRICS_ENABLED = True
+CLASSIFIER_METRICS_DIR = BASE_DIR / 'cache' / 'metrics'
+CLASSIFIER_METRICS_FLUSH_INTERVAL = 1.0
+CLASSIFIER_SERVER_TIMING = True